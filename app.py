@@ -26,6 +26,7 @@ from page_modules import (
 
 # Brand configuration import
 from brand_config import BRAND_SCHEMA, get_brand_texts, PORTFOLIO_USERS
+from export_jobs import render_export_jobs
 
 # ------------------------
 # [Security utility import]
@@ -383,7 +384,18 @@ def admin_page():
         
         with col3:
             st.metric("Admin Count", len([u for u, info in USERS.items() if info['role'] == 'admin']))
-    
+
+        # Registered queries (cache TTL, freshness and warehouse execution timing)
+        st.subheader("Query Registry")
+        try:
+            from query_registry import describe_queries, clear_cache
+            st.dataframe(describe_queries(), use_container_width=True, hide_index=True)
+            if st.button("Clear Query Cache"):
+                clear_cache()
+                st.success("Query cache cleared.")
+        except ImportError:
+            st.info("Query registry is not available.")
+
     with tab4:
         st.header("Security Settings")
         
@@ -412,14 +424,18 @@ def admin_page():
 # ------------------------
 # [Snowflake connection and session management]
 # ------------------------
-# For portfolio demonstration, we'll use a simple mock connection
+# Process-wide pooled Snowpark session (no login per rerun).
+# Falls back to a simple mock connection for portfolio demonstration.
 try:
     from snowflake_connection import get_session
     session = get_session()
 except ImportError:
+    session = None
+
+if session is None:
     # Use simple mock session for portfolio
     class MockSession:
-        def sql(self, query):
+        def sql(self, query, params=None):
             # Return empty DataFrame for demonstration
             return pd.DataFrame()
     session = MockSession()
@@ -717,6 +733,9 @@ elif st.session_state.page == "Admin Page":
 # Footer image display
 display_footer_image()
 
+# Background export jobs of this session (sidebar)
+render_export_jobs()
+
 # Sidebar feature overview
 def show_sidebar_info():
     with st.sidebar:
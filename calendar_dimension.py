@@ -0,0 +1,74 @@
+"""
+Calendar dimension for Tesla Portfolio Analytics Platform
+Typed month / weekday / ISO week attributes derived once per distinct date
+"""
+
+import pandas as pd
+
+WEEKDAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKDAY_DTYPE = pd.CategoricalDtype(WEEKDAY_ORDER, ordered=True)
+
+CALENDAR_COLUMNS = ("MONTH", "WEEKDAY", "ISO_YEAR", "ISO_WEEK")
+
+
+def calendar_dimension(dates):
+    """
+    Calendar attributes for the distinct days in dates
+
+    Args:
+        dates (array-like): datetime64 values (duplicates and NaT allowed)
+
+    Returns:
+        pd.DataFrame: One row per day, indexed by DATE, with
+            MONTH ('YYYY-MM', category), WEEKDAY (ordered category),
+            ISO_YEAR and ISO_WEEK (small integers)
+    """
+    days = pd.DatetimeIndex(pd.unique(pd.DatetimeIndex(dates).normalize())).dropna().sort_values()
+    iso = days.isocalendar()
+    return pd.DataFrame({
+        "MONTH": pd.Categorical(days.strftime("%Y-%m")),
+        "WEEKDAY": pd.Categorical(days.day_name(), dtype=WEEKDAY_DTYPE),
+        "ISO_YEAR": iso["year"].to_numpy(dtype="int16"),
+        "ISO_WEEK": iso["week"].to_numpy(dtype="int8"),
+    }, index=pd.Index(days, name="DATE"))
+
+
+def calendar_prefix(date_column):
+    """Column prefix for derived attributes (ORDER_YMD -> ORDER, ORDER_DATE -> ORDER)"""
+    for suffix in ("_YMD", "_DATE", "_TIMESTAMP"):
+        if date_column.endswith(suffix):
+            return date_column[: -len(suffix)]
+    return date_column
+
+
+def add_calendar_columns(frame, date_column, columns=CALENDAR_COLUMNS):
+    """
+    Join calendar attributes onto a frame (in place)
+
+    Attributes are computed on the distinct days only and broadcast back by
+    position, so the cost is independent of the row count. New columns are
+    named <prefix>_<attribute>, e.g. ORDER_YMD -> ORDER_MONTH, ORDER_WEEKDAY.
+
+    Args:
+        frame (pd.DataFrame): Frame with a parsed datetime64 date column
+        date_column (str): Column to derive from
+        columns (Iterable[str]): Attributes to add (default CALENDAR_COLUMNS)
+
+    Returns:
+        pd.DataFrame: The same frame with calendar columns added
+    """
+    dates = pd.DatetimeIndex(frame[date_column]).normalize()
+    dimension = calendar_dimension(dates)
+    positions = dimension.index.get_indexer(dates)
+    missing = positions < 0  # NaT dates have no calendar row
+    prefix = calendar_prefix(date_column)
+
+    for column in columns:
+        if dimension.empty:
+            values = dimension[column].reindex(range(len(frame)))
+        else:
+            values = dimension[column].take(positions.clip(min=0)).reset_index(drop=True)
+            if missing.any():
+                values = values.where(~missing)
+        frame[f"{prefix}_{column}"] = values.array
+    return frame
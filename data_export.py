@@ -0,0 +1,347 @@
+"""
+Data export for Tesla Portfolio Analytics Platform
+CSV, gzip CSV, Parquet and Excel downloads of page DataFrames and streaming exports of registry queries
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+import snapshot_cache
+from query_registry import freeze_params, get_query, render_query
+from snowflake_connection_simple import arrow_to_pandas
+
+logger = logging.getLogger(__name__)
+
+# Export files (reused for the query's cache TTL); empty uses the system temp dir
+EXPORT_DIR = os.getenv("EXPORT_DIR", "cache/exports")
+
+PREVIEW_ROWS = 100
+
+# Excel worksheets hold at most 1,048,576 rows including the header
+EXCEL_MAX_ROWS = 1_048_575
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    """A download file format"""
+    label: str
+    suffix: str
+    mime: str
+
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("CSV", ".csv", "text/csv"),
+    "csv.gz": ExportFormat("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "parquet": ExportFormat("Parquet (zstd)", ".parquet", "application/vnd.apache.parquet"),
+    "xlsx": ExportFormat("Excel", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Formats stream_query_export() can write batch by batch
+STREAMING_FORMATS = ("csv", "csv.gz", "parquet")
+
+
+@dataclass
+class ExportResult:
+    """A finished export file"""
+    path: Path
+    rows: int
+    preview: pd.DataFrame
+    created_at: float
+    reused: bool = False
+
+
+def export_dir():
+    """Export directory, created on first use"""
+    path = Path(EXPORT_DIR) if EXPORT_DIR else Path(tempfile.gettempdir()) / "tpc_exports"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _open_text(path, compress):
+    # utf-8-sig writes the BOM once so Excel detects UTF-8
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8-sig", newline="")
+    return open(path, "w", encoding="utf-8-sig", newline="")
+
+
+class _CsvBatchWriter:
+    def __init__(self, path, compress):
+        self._file = _open_text(path, compress)
+        self._header = True
+
+    def write(self, table):
+        arrow_to_pandas(table).to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetBatchWriter:
+    # The first batch fixes the schema and later batches are cast to it. Integer
+    # columns are widened to int64 because the connector picks each batch's
+    # NUMBER width from the values it holds.
+    def __init__(self, path):
+        self._path = path
+        self._writer = None
+
+    def write(self, table):
+        if self._writer is None:
+            schema = pa.schema([
+                field.with_type(pa.int64()) if pa.types.is_integer(field.type) else field
+                for field in table.schema
+            ])
+            self._writer = pq.ParquetWriter(self._path, schema, compression="zstd")
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _arrow_batches(session, sql, bind_values):
+    # Pooled sessions fetch Arrow batches straight from the connector; plain
+    # Snowpark sessions only offer pandas batches, which are converted back
+    query = session.sql(sql, params=bind_values or None)
+    if hasattr(query, "to_arrow_batches"):
+        yield from query.to_arrow_batches()
+    else:
+        for batch in query.to_pandas_batches():
+            yield pa.Table.from_pandas(batch, preserve_index=False)
+
+
+def _read_preview(path, fmt):
+    if fmt == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=PREVIEW_ROWS)
+        return next(batches, pa.RecordBatch.from_pylist([])).to_pandas()
+    return pd.read_csv(path, nrows=PREVIEW_ROWS, encoding="utf-8-sig")
+
+
+def _read_manifest(path, ttl):
+    manifest_path = path.with_name(path.name + ".json")
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not path.exists() or time.time() - manifest.get("created_at", 0) >= ttl:
+        return None
+    return manifest
+
+
+def stream_query_export(session, name, schema, brand, params=None, fmt="csv", rename=None, progress=None):
+    """
+    Export a registered query to a file by streaming result batches to disk
+
+    Result batches are fetched as Arrow tables and appended to a temp file (CSV
+    rows, or one Parquet row group per batch written without a pandas round
+    trip), so memory stays at one batch regardless of the row count. The file is renamed into place when complete and
+    reused by later calls within the query's TTL.
+
+    Args:
+        session: Snowpark session (or pooled session proxy)
+        name (str): Registered query name
+        schema (str): Brand schema
+        brand (str): Brand key
+        params (dict): Bind/filter parameter values
+        fmt (str): One of STREAMING_FORMATS ('csv', 'csv.gz' or 'parquet')
+        rename (dict): Column renames applied to every batch (e.g., display headers)
+        progress (callable): Called with the number of rows written after each batch
+
+    Returns:
+        ExportResult: Export file, row count and the first PREVIEW_ROWS rows
+
+    Raises:
+        ValueError: If fmt cannot be written batch by batch
+    """
+    if fmt not in STREAMING_FORMATS:
+        raise ValueError(f"Format '{fmt}' is not supported for streaming exports")
+    spec = get_query(name)
+    directory = export_dir()
+    key_params = freeze_params(params)
+    if rename:
+        key_params += (("__rename__", tuple(sorted(rename.items()))),)
+    path = directory / f"{snapshot_cache.snapshot_key(name, schema, brand, key_params)}{EXPORT_FORMATS[fmt].suffix}"
+
+    manifest = _read_manifest(path, spec.ttl)
+    if manifest is not None:
+        return ExportResult(path, manifest["rows"], _read_preview(path, fmt), manifest["created_at"], reused=True)
+
+    sql, bind_values = render_query(spec, schema, brand, params)
+    created_at = time.time()
+    rows = 0
+    preview = None
+
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=f".{path.name}-", suffix=".tmp")
+    os.close(fd)
+    try:
+        writer = _ParquetBatchWriter(temp_name) if fmt == "parquet" else _CsvBatchWriter(temp_name, fmt == "csv.gz")
+        try:
+            for batch in _arrow_batches(session, sql, bind_values):
+                if rename:
+                    batch = batch.rename_columns([rename.get(column, column) for column in batch.column_names])
+                if preview is None or len(preview) < PREVIEW_ROWS:
+                    head = batch.slice(0, PREVIEW_ROWS).to_pandas()
+                    preview = head if preview is None else pd.concat([preview, head]).head(PREVIEW_ROWS)
+                rows += batch.num_rows
+                writer.write(batch)
+                if progress is not None:
+                    progress(rows)
+        finally:
+            writer.close()
+        os.replace(temp_name, path)
+    except BaseException:
+        # Failed, or abandoned by a rerun: the partial file is never published
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+    path.with_name(path.name + ".json").write_text(
+        json.dumps({"rows": rows, "created_at": created_at}), encoding="utf-8"
+    )
+    logger.info("export query=%s format=%s rows=%d bytes=%d elapsed_ms=%.1f",
+                name, fmt, rows, path.stat().st_size, (time.time() - created_at) * 1000)
+    return ExportResult(path, rows, preview if preview is not None else pd.DataFrame(), created_at)
+
+
+def frame_fingerprint(frame):
+    """
+    Content hash of a DataFrame (values, column names and dtypes)
+
+    Returns:
+        str: Hex digest, or None when the frame holds unhashable values
+    """
+    try:
+        hashed = pd.util.hash_pandas_object(frame, index=False)
+    except TypeError:
+        return None
+    digest = hashlib.sha256(hashed.to_numpy().tobytes())
+    digest.update(repr((list(frame.columns), [str(dtype) for dtype in frame.dtypes])).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def available_formats(frame=None):
+    """
+    Download formats that can be produced here
+
+    Excel needs openpyxl and a frame known to fit the worksheet row limit, so it
+    is left out when the frame is not built yet (its size is unknown until the click).
+
+    Args:
+        frame (pd.DataFrame): Data to export, if already built
+
+    Returns:
+        list: EXPORT_FORMATS keys
+    """
+    formats = ["csv", "csv.gz", "parquet"]
+    if importlib.util.find_spec("openpyxl") is not None and frame is not None and len(frame) <= EXCEL_MAX_ROWS:
+        formats.append("xlsx")
+    return formats
+
+
+def serialize_frame(frame, fmt="csv"):
+    """
+    Encode a DataFrame as a download file
+
+    Args:
+        frame (pd.DataFrame): Data to export
+        fmt (str): EXPORT_FORMATS key
+
+    Returns:
+        bytes: File contents
+
+    Raises:
+        ValueError: If the frame does not fit an Excel worksheet
+    """
+    if fmt == "parquet":
+        # pandas -> Arrow is zero-copy for numeric columns; zstd is fast and 5-10x smaller than CSV
+        sink = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), sink, compression="zstd")
+        return sink.getvalue().to_pybytes()
+    if fmt == "xlsx":
+        if len(frame) > EXCEL_MAX_ROWS:
+            raise ValueError(f"{len(frame):,} rows exceed the Excel limit of {EXCEL_MAX_ROWS:,}; use CSV or Parquet")
+        buffer = io.BytesIO()
+        frame.to_excel(buffer, index=False, engine="openpyxl")
+        return buffer.getvalue()
+    # utf-8-sig (BOM) so Excel shows Korean region/item names, as in streamed exports
+    if fmt == "csv.gz":
+        # mtime=0 keeps the bytes identical for identical data
+        return gzip.compress(frame.to_csv(index=False).encode("utf-8-sig"), compresslevel=6, mtime=0)
+    return frame.to_csv(index=False).encode("utf-8-sig")
+
+
+@st.cache_data(ttl=1800, max_entries=32, show_spinner=False)
+def _serialize_cached(fingerprint, fmt, _frame):
+    return serialize_frame(_frame, fmt)
+
+
+def frame_bytes(frame, fmt="csv"):
+    """Encoded frame, reused across clicks and sessions for identical content and format"""
+    fingerprint = frame_fingerprint(frame)
+    if fingerprint is None:
+        return serialize_frame(frame, fmt)
+    return _serialize_cached(fingerprint, fmt, frame)
+
+
+def _with_suffix(file_name, suffix):
+    stem = file_name[:-len(".csv")] if file_name.endswith(".csv") else file_name
+    return stem + suffix
+
+
+def frame_download_button(label, frame, file_name, key=None, formats=None, **kwargs):
+    """
+    Download button with a format selector that serializes only when clicked
+
+    The payload is a callable, so reruns cost nothing until the user asks for the
+    file; serialization then runs off the script thread and is cached by content
+    fingerprint and format.
+
+    Args:
+        label (str): Button label
+        frame (pd.DataFrame | callable): Data, or a zero-argument function building it
+            (e.g., when assembling the download frame is itself expensive)
+        file_name (str): Downloaded file name; a '.csv' suffix is replaced to match the format
+        key (str): Widget key (the format selector uses '<key>-format')
+        formats (list): EXPORT_FORMATS keys to offer (default: available_formats(); no
+            Excel for callable frames unless listed here)
+        **kwargs: Passed through to st.download_button (help, type, ...)
+
+    Returns:
+        bool: Whether the button was clicked on this run
+    """
+    if formats is None:
+        formats = available_formats(None if callable(frame) else frame)
+    fmt = formats[0]
+    if len(formats) > 1:
+        fmt = st.selectbox(
+            "File format",
+            formats,
+            format_func=lambda option: EXPORT_FORMATS[option].label,
+            key=f"{key or label}-format",
+        )
+    export_format = EXPORT_FORMATS[fmt]
+
+    def payload():
+        return frame_bytes(frame() if callable(frame) else frame, fmt)
+
+    return st.download_button(
+        label,
+        data=payload,
+        file_name=_with_suffix(file_name, export_format.suffix),
+        mime=export_format.mime,
+        key=key,
+        **kwargs,
+    )
@@ -0,0 +1,109 @@
+"""
+Post-load DataFrame normalization for Tesla Portfolio Analytics Platform
+Compact, analysis-ready dtypes applied once when a query result is loaded
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality dimension columns stored as pandas 'category'
+CATEGORICAL_COLUMNS = frozenset({
+    "ITEM_NAME",
+    "ADDR_CODE",
+    "AGE_GROUP",
+    "GENDER",
+    "JOIN_WEEKDAY",
+    "STORE_NAME",
+})
+
+# A column is only converted when distinct values are at most this share of the rows
+MAX_CATEGORY_RATIO = 0.5
+
+# Date columns parsed once at load: column -> strptime format (None = infer)
+DATE_COLUMNS = {
+    "ORDER_YMD": "%Y%m%d",
+    "MIN_ORDER_YMD": "%Y%m%d",
+    "MAX_ORDER_YMD": "%Y%m%d",
+    "ORDER_TIMESTAMP": None,
+}
+
+# Integer count columns are downcast, but never below int32 so that
+# arithmetic on them (e.g., count * unit price) cannot overflow
+COUNT_SUFFIXES = ("_COUNT", "_CUSTOMERS")
+MIN_COUNT_DTYPE = np.int32
+
+
+def is_count_column(column):
+    """Whether a column holds integer counts (ORDER_COUNT, TOTAL_CUSTOMERS, ...)"""
+    return isinstance(column, str) and column.upper().endswith(COUNT_SUFFIXES)
+
+
+def _to_category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if not (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)):
+        return series
+    if len(series) and series.nunique(dropna=True) > len(series) * MAX_CATEGORY_RATIO:
+        return series
+    return series.astype("category")
+
+
+def _downcast_count(series):
+    if not pd.api.types.is_integer_dtype(series.dtype) or pd.api.types.is_extension_array_dtype(series.dtype):
+        return series
+    if series.dtype == MIN_COUNT_DTYPE:
+        return series
+    # Narrower columns (e.g., int8 from a small Arrow batch) are upcast to int32
+    if np.dtype(series.dtype).itemsize >= np.dtype(MIN_COUNT_DTYPE).itemsize:
+        limits = np.iinfo(MIN_COUNT_DTYPE)
+        if len(series) and (series.min() < limits.min or series.max() > limits.max):
+            return series
+    return series.astype(MIN_COUNT_DTYPE)
+
+
+def _parse_date(series, date_format):
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series
+    if date_format:
+        # YYYYMMDD may arrive as NUMBER or VARCHAR
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            series = series.astype("Int64").astype("string")
+        return pd.to_datetime(series, format=date_format)
+    return pd.to_datetime(series)
+
+
+def normalize_frame(frame, categorical=None, dates=None):
+    """
+    Convert a freshly loaded DataFrame to compact dtypes (in place)
+
+    - Low-cardinality dimension columns -> category
+    - Integer count columns -> int32
+    - ORDER_YMD / ORDER_TIMESTAMP -> datetime64 (parsed once)
+
+    Args:
+        frame (pd.DataFrame): Query result
+        categorical (Iterable[str]): Dimension columns (default CATEGORICAL_COLUMNS)
+        dates (dict): Date column -> format (default DATE_COLUMNS)
+
+    Returns:
+        pd.DataFrame: The same frame with normalized dtypes
+    """
+    categorical = CATEGORICAL_COLUMNS if categorical is None else frozenset(categorical)
+    dates = DATE_COLUMNS if dates is None else dates
+
+    for column in frame.columns:
+        try:
+            if column in dates:
+                frame[column] = _parse_date(frame[column], dates[column])
+            elif column in categorical:
+                frame[column] = _to_category(frame[column])
+            elif is_count_column(column):
+                frame[column] = _downcast_count(frame[column])
+        except (ValueError, TypeError) as e:
+            # Leave the column as loaded rather than failing the page
+            logger.warning("dtype normalization skipped for column %s: %s", column, e)
+    return frame
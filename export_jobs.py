@@ -0,0 +1,379 @@
+"""
+Background export jobs for Tesla Portfolio Analytics Platform
+Large query exports run on a bounded worker pool so they never block a script run
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import streamlit as st
+
+from data_export import EXPORT_FORMATS, STREAMING_FORMATS, export_dir, stream_query_export
+from query_registry import freeze_params
+
+logger = logging.getLogger(__name__)
+
+# Concurrent exports per app process (each holds one warehouse session while streaming)
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+
+# Finished jobs and export files older than this are removed
+EXPORT_JOB_RETENTION_SECONDS = int(os.getenv("EXPORT_JOB_RETENTION_HOURS", "24")) * 3600
+
+# Sidebar refresh interval while a job is queued or running
+JOB_PANEL_REFRESH_SECONDS = 2
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+_SESSION_JOBS_KEY = "export_job_ids"
+_PANEL_POLLING_KEY = "export_job_panel_polling"
+_PENDING_TOAST_KEY = "export_job_toast"
+
+
+class ExportCancelled(Exception):
+    """A running export job was cancelled by its user"""
+
+
+@dataclass
+class ExportJob:
+    """A submitted export and its progress"""
+    job_id: str
+    title: str
+    name: str
+    schema: str
+    brand: str
+    params: Optional[Dict[str, Any]]
+    fmt: str
+    file_name: str
+    rename: Optional[Dict[str, str]] = None
+    status: str = QUEUED
+    rows: int = 0
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    path: Optional[Path] = None
+    preview: Optional[pd.DataFrame] = None
+    error: Optional[str] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def key(self):
+        """Identity of the exported data (same key, same file)"""
+        return export_key(self.name, self.schema, self.brand, self.params, self.fmt, self.rename)
+
+    @property
+    def is_active(self):
+        return self.status in ACTIVE_STATES
+
+
+def export_key(name, schema, brand, params=None, fmt="csv", rename=None):
+    """Hashable identity of an export: query, parameters, format and column renames"""
+    frozen_rename = tuple(sorted(rename.items())) if rename else ()
+    return (name, schema, brand, freeze_params(params), fmt, frozen_rename)
+
+
+class ExportJobQueue:
+    """
+    Export jobs running on a bounded thread pool
+
+    Jobs are shared by every session of the app process; each session only lists
+    the job IDs it submitted. Export files are written by stream_query_export()
+    into the export directory, so a job for data exported within the query's TTL
+    finishes immediately with the existing file.
+
+    Args:
+        max_workers (int): Exports running at the same time; later jobs queue
+        retention_seconds (float): Age after which finished jobs and files are removed
+    """
+
+    def __init__(self, max_workers=EXPORT_JOB_WORKERS, retention_seconds=EXPORT_JOB_RETENTION_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export-job")
+        self._retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ExportJob] = {}
+        self._futures = {}
+
+    def submit(self, session, name, schema, brand, params=None, fmt="csv",
+               file_name=None, title=None, rename=None):
+        """
+        Queue an export of a registered query
+
+        An identical export that is still queued or running is returned instead of
+        starting a second one.
+
+        Args:
+            session: Snowpark session (or pooled session proxy) used by the worker
+            name (str): Registered query name
+            schema (str): Brand schema
+            brand (str): Brand key
+            params (dict): Bind/filter parameter values
+            fmt (str): One of STREAMING_FORMATS
+            file_name (str): Download file name without suffix (default: query name)
+            title (str): Label shown in the job list
+            rename (dict): Column renames applied to the exported rows
+
+        Returns:
+            ExportJob: The new or already running job
+
+        Raises:
+            ValueError: If fmt cannot be streamed
+        """
+        if fmt not in STREAMING_FORMATS:
+            raise ValueError(f"Format '{fmt}' is not supported for export jobs")
+        self.cleanup()
+
+        job = ExportJob(
+            job_id=uuid.uuid4().hex[:12],
+            title=title or name,
+            name=name,
+            schema=schema,
+            brand=brand,
+            params=dict(params) if params else None,
+            fmt=fmt,
+            file_name=f"{file_name or name}{EXPORT_FORMATS[fmt].suffix}",
+            rename=dict(rename) if rename else None,
+        )
+        with self._lock:
+            for existing in self._jobs.values():
+                if existing.is_active and existing.key == job.key:
+                    return existing
+            self._jobs[job.job_id] = job
+            self._futures[job.job_id] = self._executor.submit(self._run, job, session)
+        logger.info("export job %s queued: query=%s format=%s", job.job_id, name, fmt)
+        return job
+
+    def _run(self, job, session):
+        if job.cancel_requested.is_set():
+            job.status, job.finished_at = CANCELLED, time.time()
+            return
+        job.status = RUNNING
+
+        def progress(rows):
+            job.rows = rows
+            if job.cancel_requested.is_set():
+                raise ExportCancelled(job.job_id)
+
+        try:
+            result = stream_query_export(
+                session, job.name, job.schema, job.brand, params=job.params,
+                fmt=job.fmt, rename=job.rename, progress=progress,
+            )
+        except ExportCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception("export job %s failed", job.job_id)
+            job.status, job.error = FAILED, str(e)
+        else:
+            job.path, job.rows, job.preview = result.path, result.rows, result.preview
+            job.status = DONE
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._futures.pop(job.job_id, None)
+        logger.info("export job %s %s: rows=%d elapsed_s=%.1f",
+                    job.job_id, job.status, job.rows, job.finished_at - job.submitted_at)
+
+    def get(self, job_id):
+        """Job by ID, or None once it has been cleaned up"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or stop a running one after its current batch"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            future = self._futures.get(job_id)
+        if job is None or not job.is_active:
+            return
+        job.cancel_requested.set()
+        if future is not None and future.cancel():
+            job.status, job.finished_at = CANCELLED, time.time()
+
+    def active_count(self):
+        """Jobs queued or running"""
+        with self._lock:
+            return sum(job.is_active for job in self._jobs.values())
+
+    def cleanup(self, now=None):
+        """
+        Forget finished jobs and delete export files past the retention period
+
+        Returns:
+            int: Number of files removed
+        """
+        now = now or time.time()
+        cutoff = now - self._retention_seconds
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if not job.is_active and (job.finished_at or now) < cutoff]:
+                del self._jobs[job_id]
+            in_use = {job.path for job in self._jobs.values() if job.path is not None}
+
+        removed = 0
+        for path in export_dir().iterdir():
+            try:
+                if path.is_file() and path not in in_use and path.stat().st_mtime < cutoff:
+                    # Includes manifests and temp files left by crashed writers
+                    path.unlink(missing_ok=True)
+                    removed += 1
+            except FileNotFoundError:
+                continue  # removed by another replica
+        if removed:
+            logger.info("export cleanup removed %d files", removed)
+        return removed
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_export_queue():
+    """Process-wide export job queue, created on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ExportJobQueue()
+        return _queue
+
+
+def session_jobs():
+    """Jobs submitted by the current browser session, newest first"""
+    queue = get_export_queue()
+    job_ids = st.session_state.get(_SESSION_JOBS_KEY, [])
+    jobs = [job for job in (queue.get(job_id) for job_id in job_ids) if job is not None]
+    st.session_state[_SESSION_JOBS_KEY] = [job.job_id for job in jobs]
+    return jobs
+
+
+def _remember(job):
+    job_ids = st.session_state.setdefault(_SESSION_JOBS_KEY, [])
+    if job.job_id in job_ids:
+        job_ids.remove(job.job_id)
+    job_ids.insert(0, job.job_id)
+
+
+def _dismiss(job_id):
+    job_ids = st.session_state.get(_SESSION_JOBS_KEY, [])
+    if job_id in job_ids:
+        job_ids.remove(job_id)
+
+
+def export_job_button(label, session, name, schema, brand, params=None, file_name=None,
+                      rename=None, key=None, **kwargs):
+    """
+    Format selector and button that queue a background export
+
+    Args:
+        label (str): Button label
+        session: Snowpark session (or pooled session proxy)
+        name (str): Registered query name
+        schema (str): Brand schema
+        brand (str): Brand key
+        params (dict): Bind/filter parameter values
+        file_name (str): Download file name without suffix
+        rename (dict): Column renames applied to the exported rows
+        key (str): Widget key (the format selector uses '<key>-format')
+        **kwargs: Passed through to st.button (help, type, ...)
+
+    Returns:
+        ExportJob: This session's most recent job for the export, or None
+    """
+    widget_key = key or f"export-job-{name}"
+    fmt = st.selectbox(
+        "File format",
+        STREAMING_FORMATS,
+        format_func=lambda option: EXPORT_FORMATS[option].label,
+        key=f"{widget_key}-format",
+    )
+    if st.button(label, key=widget_key, **kwargs):
+        job = get_export_queue().submit(
+            session, name, schema, brand, params=params, fmt=fmt,
+            file_name=file_name, title=label, rename=rename,
+        )
+        _remember(job)
+        message = f"Export job {job.job_id} started; progress is shown in the sidebar."
+        if st.session_state.get(_PANEL_POLLING_KEY):
+            st.toast(message)
+        else:
+            # The sidebar panel only polls when a job was active at the last full run
+            # (and is not rerun at all when this button lives in a fragment)
+            st.session_state[_PENDING_TOAST_KEY] = message
+            st.rerun()
+
+    selected_key = export_key(name, schema, brand, params, fmt, rename)
+    for job in session_jobs():
+        if job.key == selected_key:
+            return job
+    return None
+
+
+def _render_job(queue, job):
+    st.markdown(f"**{job.title}**  \n`{job.job_id}` · {EXPORT_FORMATS[job.fmt].label}")
+    if job.status == QUEUED:
+        st.caption("Queued, waiting for a free worker...")
+    elif job.status == RUNNING:
+        st.caption(f"Running... {job.rows:,} rows written")
+    elif job.status == DONE:
+        size_mb = job.path.stat().st_size / 1024 / 1024 if job.path.exists() else 0
+        st.caption(f"Done: {job.rows:,} rows, {size_mb:.1f} MB")
+        st.download_button(
+            "📥 Download",
+            data=job.path.read_bytes,  # read on click only
+            file_name=job.file_name,
+            mime=EXPORT_FORMATS[job.fmt].mime,
+            key=f"export-job-download-{job.job_id}",
+            on_click="ignore",
+        )
+    elif job.status == FAILED:
+        st.error(f"Failed: {job.error}")
+    else:
+        st.caption("Cancelled")
+
+    if job.is_active:
+        st.button("Cancel", key=f"export-job-cancel-{job.job_id}", on_click=queue.cancel, args=(job.job_id,))
+    else:
+        st.button("Dismiss", key=f"export-job-dismiss-{job.job_id}", on_click=_dismiss, args=(job.job_id,))
+
+
+def render_export_jobs():
+    """
+    Sidebar list of this session's export jobs
+
+    Refreshes itself every JOB_PANEL_REFRESH_SECONDS while a job is queued or
+    running, without rerunning the page. run_every is fixed per full run, so the
+    panel triggers one app rerun when the last active job finishes to stop polling.
+    """
+    message = st.session_state.pop(_PENDING_TOAST_KEY, None)
+    if message:
+        st.toast(message)
+
+    jobs = session_jobs()
+    polling = any(job.is_active for job in jobs)
+    st.session_state[_PANEL_POLLING_KEY] = polling
+    if not jobs:
+        return
+    queue = get_export_queue()
+
+    @st.fragment(run_every=JOB_PANEL_REFRESH_SECONDS if polling else None)
+    def job_panel():
+        current_jobs = session_jobs()
+        st.markdown("---")
+        st.markdown("### 📦 **Export Jobs**")
+        for job in current_jobs:
+            _render_job(queue, job)
+        if polling and not any(job.is_active for job in current_jobs):
+            st.rerun()
+
+    with st.sidebar:
+        job_panel()
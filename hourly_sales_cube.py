@@ -0,0 +1,270 @@
+"""
+Hourly sales cube for Tesla Portfolio Analytics Platform
+(date x hour x region x item) order counts built once per cache refresh, dense
+NumPy array or sparse cell list depending on size
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from query_registry import derived_cache, run_query
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24
+
+# Largest dense cube kept in memory (int32 cells; 100M cells = 400 MB). Larger
+# (date x hour x region x item) ranges keep only their non-empty cells instead.
+CUBE_MAX_CELLS = int(os.getenv("HOURLY_CUBE_MAX_CELLS", str(100_000_000)))
+
+
+class HourlySalesCube:
+    """
+    Order counts with integer-coded dimensions
+
+    Dates are the days with at least one order, sorted, so a date range is a
+    contiguous slice. While the dense shape fits in CUBE_MAX_CELLS, counts[d, h, r, i]
+    is the number of orders on dates[d], hour h, in regions[r] for items[i].
+    Beyond that the cube keeps one entry per non-empty cell (sorted by cell) and
+    counts is None. Both layouts answer the same select() calls and are read-only
+    and shared between sessions.
+    """
+
+    def __init__(self, dates, regions, items, counts=None, cells=None, duplicates_removed=0):
+        self.dates = dates
+        self.regions = list(regions)
+        self.items = list(items)
+        self.counts = counts
+        self.cells = cells
+        for array in ([counts] if counts is not None else list(cells)):
+            array.setflags(write=False)
+        self.duplicates_removed = duplicates_removed
+        self._region_index = {region: index for index, region in enumerate(self.regions)}
+        self._item_index = {item: index for index, item in enumerate(self.items)}
+
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Build the cube from HOURLY_PRODUCT_SALES_BY_REGION rows
+
+        Args:
+            frame (pd.DataFrame): ADDR_CODE, ITEM_NAME, ORDER_TIMESTAMP (datetime64), ORDER_COUNT,
+                already deduplicated at load (duplicate count in frame.attrs)
+
+        Returns:
+            HourlySalesCube: Cube over every day in the frame
+        """
+        duplicates_removed = frame.attrs.get("duplicates_removed", 0)
+
+        timestamps = pd.DatetimeIndex(frame["ORDER_TIMESTAMP"])
+        order_counts = frame["ORDER_COUNT"]
+        # Null timestamps, dimensions or counts cannot be placed in a cell
+        valid = ~timestamps.isna() & order_counts.notna().to_numpy()
+        region_codes, regions = pd.factorize(frame["ADDR_CODE"], sort=True)
+        item_codes, items = pd.factorize(frame["ITEM_NAME"], sort=True)
+        valid &= (region_codes >= 0) & (item_codes >= 0)
+
+        if not valid.any():
+            empty = np.zeros((0, HOURS_PER_DAY, len(regions), len(items)), dtype=np.int32)
+            return cls(np.array([], dtype="datetime64[D]"), regions, items, empty,
+                       duplicates_removed=duplicates_removed)
+
+        days = timestamps[valid].normalize().to_numpy().astype("datetime64[D]")
+        dates, day_codes = np.unique(days, return_inverse=True)
+        hours = timestamps[valid].hour.to_numpy()
+        values = order_counts.to_numpy()[valid].astype(np.int32)
+        shape = (len(dates), HOURS_PER_DAY, len(regions), len(items))
+        flat_index = np.ravel_multi_index((day_codes, hours, region_codes[valid], item_codes[valid]), shape)
+
+        if int(np.prod(shape, dtype=np.int64)) <= CUBE_MAX_CELLS:
+            # Scatter-add every row into its cell (rows sharing a cell are summed)
+            counts = np.zeros(int(np.prod(shape)), dtype=np.int32)
+            np.add.at(counts, flat_index, values)
+            cube = cls(dates, regions, items, counts.reshape(shape), duplicates_removed=duplicates_removed)
+            memory = cube.counts.nbytes
+        else:
+            # Sum rows per cell; cells come out sorted by (date, hour, region, item)
+            cell_index, inverse = np.unique(flat_index, return_inverse=True)
+            cell_counts = np.zeros(len(cell_index), dtype=np.int32)
+            np.add.at(cell_counts, inverse, values)
+            cell_days, cell_hours, cell_regions, cell_items = np.unravel_index(cell_index, shape)
+            cells = (cell_days, cell_hours, cell_regions, cell_items, cell_counts)
+            cube = cls(dates, regions, items, cells=cells, duplicates_removed=duplicates_removed)
+            memory = sum(array.nbytes for array in cells)
+
+        logger.info("hourly sales cube built: shape=%s rows=%d layout=%s memory_mb=%.1f",
+                    shape, len(frame), "sparse" if cube.counts is None else "dense",
+                    memory / 1024 / 1024)
+        return cube
+
+    @property
+    def is_empty(self):
+        return len(self.dates) == 0 or not self.regions or not self.items
+
+    def select(self, start_date, end_date, start_hour=0, end_hour=HOURS_PER_DAY - 1, region=None):
+        """
+        Slice the cube for a date range, inclusive hour range and region
+
+        Args:
+            start_date, end_date (date): Inclusive date range
+            start_hour, end_hour (int): Inclusive hour range (0-23)
+            region (str): Region name, or None for all regions
+
+        Returns:
+            CubeSlice: View over the selected cells (no copy for a dense cube)
+        """
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right")
+        hours = np.arange(start_hour, max(start_hour, end_hour + 1))
+
+        if region is None:
+            region_slice, regions = slice(None), self.regions
+        elif region in self._region_index:
+            index = self._region_index[region]
+            region_slice, regions = slice(index, index + 1), [region]
+        else:
+            region_slice, regions = slice(0, 0), []
+
+        if self.counts is not None:
+            view = self.counts[lo:hi, start_hour:start_hour + len(hours), region_slice, :]
+            return CubeSlice(view, self.dates[lo:hi], hours, regions, self.items, self._item_index)
+
+        cell_days, cell_hours, cell_regions, cell_items, cell_counts = self.cells
+        first, last = np.searchsorted(cell_days, [lo, hi], side="left")
+        keep = (cell_hours[first:last] >= start_hour) & (cell_hours[first:last] < start_hour + len(hours))
+        region_start = region_slice.start or 0
+        if region_slice.stop is not None:
+            keep &= (cell_regions[first:last] >= region_start) & (cell_regions[first:last] < region_slice.stop)
+        cells = (
+            cell_days[first:last][keep] - lo,
+            cell_hours[first:last][keep] - start_hour,
+            cell_regions[first:last][keep] - region_start,
+            cell_items[first:last][keep],
+            cell_counts[first:last][keep],
+        )
+        return SparseCubeSlice(cells, self.dates[lo:hi], hours, regions, self.items, self._item_index)
+
+
+class CubeSlice:
+    """Selected part of an HourlySalesCube with the aggregations the page needs"""
+
+    def __init__(self, counts, dates, hours, regions, items, item_index):
+        self.counts = counts
+        self.dates = dates
+        self.hours = hours
+        self.regions = regions
+        self.items = items
+        self._item_index = item_index
+
+    def _item_view(self, item):
+        if item is None:
+            return self.counts
+        index = self._item_index.get(item)
+        if index is None:
+            return self.counts[..., 0:0]
+        return self.counts[..., index:index + 1]
+
+    def _totals(self, axes, item=None):
+        """Order counts summed over every axis except axes (1=hour, 2=region, 3=item)"""
+        return self._item_view(item).sum(axis=tuple(axis for axis in range(4) if axis not in axes))
+
+    def total(self):
+        return int(self._totals(()))
+
+    def item_totals(self):
+        """Orders per item, descending (items without orders omitted)"""
+        totals = self._totals((3,))
+        result = pd.DataFrame({"ITEM_NAME": self.items, "ORDER_COUNT": totals})
+        result = result[result["ORDER_COUNT"] > 0]
+        return result.sort_values("ORDER_COUNT", ascending=False, kind="stable").reset_index(drop=True)
+
+    def hourly_totals(self, item=None):
+        """Orders per hour for all items or one item (hours without orders omitted)"""
+        totals = self._totals((1,), item)
+        result = pd.DataFrame({"HOUR": self.hours, "ORDER_COUNT": totals})
+        return result[result["ORDER_COUNT"] > 0].reset_index(drop=True)
+
+    def hourly_by_items(self, items):
+        """Long (HOUR, ITEM_NAME, ORDER_COUNT) frame for the given items"""
+        indices = [self._item_index[item] for item in items if item in self._item_index]
+        matrix = self._totals((1, 3))[:, indices]  # hour x item
+        hour_pos, item_pos = np.nonzero(matrix)
+        return pd.DataFrame({
+            "HOUR": self.hours[hour_pos],
+            "ITEM_NAME": [self.items[indices[pos]] for pos in item_pos],
+            "ORDER_COUNT": matrix[hour_pos, item_pos],
+        })
+
+    def region_hourly(self, item=None):
+        """Long (ADDR_CODE, HOUR, ORDER_COUNT) frame for all items or one item"""
+        matrix = self._totals((1, 2), item).T  # region x hour
+        region_pos, hour_pos = np.nonzero(matrix)
+        return pd.DataFrame({
+            "ADDR_CODE": [self.regions[pos] for pos in region_pos],
+            "HOUR": self.hours[hour_pos],
+            "ORDER_COUNT": matrix[region_pos, hour_pos],
+        })
+
+    def _nonzero_cells(self):
+        date_pos, hour_pos, region_pos, item_pos = np.nonzero(self.counts)
+        return date_pos, hour_pos, region_pos, item_pos, self.counts[date_pos, hour_pos, region_pos, item_pos]
+
+    def to_frame(self):
+        """Non-empty cells as rows (ADDR_CODE, ITEM_NAME, DATE, HOUR, ORDER_COUNT)"""
+        date_pos, hour_pos, region_pos, item_pos, counts = self._nonzero_cells()
+        return pd.DataFrame({
+            "ADDR_CODE": pd.Categorical.from_codes(region_pos, self.regions) if self.regions else [],
+            "ITEM_NAME": pd.Categorical.from_codes(item_pos, self.items) if self.items else [],
+            "DATE": pd.to_datetime(self.dates[date_pos]).date,
+            "HOUR": self.hours[hour_pos],
+            "ORDER_COUNT": counts,
+        })
+
+
+class SparseCubeSlice(CubeSlice):
+    """CubeSlice over a sparse cube's cells; sums are bincounts over the kept axes"""
+
+    def __init__(self, cells, dates, hours, regions, items, item_index):
+        super().__init__(None, dates, hours, regions, items, item_index)
+        self.cells = cells
+
+    def _totals(self, axes, item=None):
+        *positions, counts = self.cells
+        if item is not None:
+            selected = positions[3] == self._item_index.get(item, -1)
+            positions, counts = [pos[selected] for pos in positions], counts[selected]
+        shape = (len(self.dates), len(self.hours), len(self.regions), len(self.items))
+        kept_shape = tuple(shape[axis] for axis in axes)
+        if not axes:
+            return counts.sum(dtype=np.int64)
+        flat_index = np.ravel_multi_index(tuple(positions[axis] for axis in axes), kept_shape)
+        totals = np.bincount(flat_index, weights=counts, minlength=int(np.prod(kept_shape)))
+        return totals.astype(np.int64).reshape(kept_shape)
+
+    def _nonzero_cells(self):
+        return self.cells
+
+
+@derived_cache("hourly_product_sales")
+@st.cache_resource(ttl=1800, show_spinner=False)
+def get_hourly_sales_cube(_session, schema, brand):
+    """
+    Hourly sales cube for a brand, rebuilt when the 30 minute cache expires
+
+    The rows come from the incrementally refreshed hourly_product_sales result,
+    so a rebuild costs a delta query plus an in-memory scatter, not a full reload.
+
+    Args:
+        _session: Snowflake session (not hashed)
+        schema (str): Brand schema
+        brand (str): Brand code
+
+    Returns:
+        HourlySalesCube: Shared, read-only cube
+    """
+    raw_data = run_query(_session, "hourly_product_sales", schema, brand)
+    return HourlySalesCube.from_frame(raw_data)
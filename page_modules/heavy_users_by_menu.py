@@ -1,12 +1,113 @@
+import os
+
 import streamlit as st
 import plotly.express as px
 import pandas as pd
 
+from query_registry import derived_cache, run_query, run_query_async
+from segmentation import assign_segments, assign_quantile_segments
+from calendar_dimension import calendar_dimension
+from data_export import frame_download_button
+from export_jobs import export_job_button
+
+# Push date/age group/gender/menu filters into the warehouse query so only the selected slice is loaded.
+# Set HEAVY_USER_FILTER_PUSHDOWN=0 to load the full summary table and filter in pandas instead.
+FILTER_PUSHDOWN = os.getenv("HEAVY_USER_FILTER_PUSHDOWN", "1") != "0"
+
+# Virtual menu prices for revenue estimation (actual DB prices must be used)
+MENU_PRICES = {
+    'Americano': 4500, 'Cafe Latte': 5000, 'Cappuccino': 5500, 'Espresso': 3500,
+    'Vanilla Latte': 6000, 'Caramel Macchiato': 6000, 'Mocha': 6500, 'Affogato': 7000
+}
+DEFAULT_MENU_PRICE = 5000
+
+@derived_cache("heavy_user_summary", "heavy_user_summary_filtered")
+@st.cache_data(ttl=3600, show_spinner=False)
+def build_menu_aggregates(filter_state, _item_data):
+    """
+    Compute every menu analytics aggregate from one base aggregation.
+
+    The rows are grouped once at (menu, age group, gender, date, segment) grain and
+    each chart's slice is rolled up from that base. Results are cached per filter
+    state, so reruns from unrelated widgets reuse them.
+
+    Args:
+        filter_state (tuple): Filter values the rows were selected with (cache key)
+        _item_data (pd.DataFrame): Filtered heavy user rows (not hashed)
+
+    Returns:
+        dict: Pre-aggregated DataFrames keyed by chart name
+    """
+    frame = _item_data[['ITEM_NAME', 'AGE_GROUP', 'GENDER', 'ORDER_YMD', 'TOTAL_ORDER_COUNT']].copy()
+    frame['Customer_Segment'] = assign_segments(frame['TOTAL_ORDER_COUNT'])
+    
+    # dropna=False keeps rows with a null age group/gender (or order count) in the per-menu
+    # and daily rollups; each rollup below drops nulls only in its own keys, as before
+    base = (
+        frame
+        .groupby(['ITEM_NAME', 'AGE_GROUP', 'GENDER', 'ORDER_YMD', 'Customer_Segment'], observed=True, sort=False, dropna=False)['TOTAL_ORDER_COUNT']
+        .agg(TOTAL_ORDER_COUNT='sum', ROW_COUNT='size')
+        .reset_index()
+    )
+    
+    def rollup(keys):
+        return base.groupby(keys, observed=True)[['TOTAL_ORDER_COUNT', 'ROW_COUNT']].sum().reset_index()
+    
+    # Order quantity by menu and gender / age group (percentage within each menu)
+    gender_data = rollup(['ITEM_NAME', 'GENDER'])[['ITEM_NAME', 'GENDER', 'TOTAL_ORDER_COUNT']]
+    gender_data['PERCENTAGE'] = (gender_data['TOTAL_ORDER_COUNT'] / gender_data.groupby('ITEM_NAME', observed=True)['TOTAL_ORDER_COUNT'].transform('sum')) * 100
+    
+    age_data = rollup(['ITEM_NAME', 'AGE_GROUP'])[['ITEM_NAME', 'AGE_GROUP', 'TOTAL_ORDER_COUNT']]
+    age_data['PERCENTAGE'] = (age_data['TOTAL_ORDER_COUNT'] / age_data.groupby('ITEM_NAME', observed=True)['TOTAL_ORDER_COUNT'].transform('sum')) * 100
+    
+    # Menu average order frequency
+    by_item = rollup(['ITEM_NAME'])
+    order_frequency = pd.DataFrame({
+        'Menu Name': by_item['ITEM_NAME'],
+        'Average Order Quantity': by_item['TOTAL_ORDER_COUNT'] / by_item['ROW_COUNT'],
+        'Total Order Quantity': by_item['TOTAL_ORDER_COUNT'],
+        'Customer Count': by_item['ROW_COUNT'],
+    })
+    order_frequency['Average Orders per Customer'] = order_frequency['Total Order Quantity'] / order_frequency['Customer Count']
+    
+    # Menu preference matrices
+    age_menu_matrix = rollup(['AGE_GROUP', 'ITEM_NAME']).pivot(index='AGE_GROUP', columns='ITEM_NAME', values='TOTAL_ORDER_COUNT').fillna(0)
+    gender_menu_matrix = rollup(['GENDER', 'ITEM_NAME']).pivot(index='GENDER', columns='ITEM_NAME', values='TOTAL_ORDER_COUNT').fillna(0)
+    
+    # Segment distribution
+    customer_segments = rollup(['ITEM_NAME', 'Customer_Segment'])[['ITEM_NAME', 'Customer_Segment', 'ROW_COUNT']]
+    customer_segments = customer_segments.rename(columns={'ROW_COUNT': 'CustomerCount'})
+    
+    # Daily order pattern and weekday average
+    daily_orders = rollup(['ORDER_YMD'])[['ORDER_YMD', 'TOTAL_ORDER_COUNT']]
+    calendar = calendar_dimension(daily_orders['ORDER_YMD']).reindex(daily_orders['ORDER_YMD'])
+    daily_orders['DayOfWeek'] = calendar['WEEKDAY'].array
+    daily_orders['Month'] = daily_orders['ORDER_YMD'].dt.month
+    
+    # Weekday is an ordered category, so the groupby already returns Monday..Sunday
+    weekday_avg = daily_orders.groupby('DayOfWeek', observed=True)['TOTAL_ORDER_COUNT'].mean().reset_index()
+    
+    # Menu revenue contribution (price depends only on the menu, so revenue rolls up from menu totals)
+    menu_revenue = by_item[['ITEM_NAME']].copy()
+    menu_revenue['Estimated_Revenue'] = by_item['TOTAL_ORDER_COUNT'] * by_item['ITEM_NAME'].astype(object).map(MENU_PRICES).fillna(DEFAULT_MENU_PRICE)
+    menu_revenue['Revenue_Ratio'] = (menu_revenue['Estimated_Revenue'] / menu_revenue['Estimated_Revenue'].sum()) * 100
+    
+    return {
+        'gender_data': gender_data,
+        'age_data': age_data,
+        'order_frequency': order_frequency,
+        'age_menu_matrix': age_menu_matrix,
+        'gender_menu_matrix': gender_menu_matrix,
+        'customer_segments': customer_segments,
+        'daily_orders': daily_orders,
+        'weekday_avg': weekday_avg,
+        'menu_revenue': menu_revenue,
+    }
+
 def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
     brand = brand or "TPC"
     schema = schema or f"ANALYSIS_{brand}"
-    table_prefix = f"DT_{brand}"
     
     # Brand-specific text mapping
     brand_texts = {
@@ -27,25 +128,17 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
     st.title(f"{current_brand['title']} Heavy User Segmentation by Menu")
 
-    # Execute data query (brand-specific dynamic table usage)
-    @st.cache_data(ttl=3600)  # 1 hour cache
-    def load_heavy_user_data(schema, table_prefix):
-        query = f"""
-            SELECT
-                ITEM_NAME,
-                AGE_GROUP,
-                GENDER,
-                ORDER_YMD,
-                TOTAL_ORDER_COUNT,
-                PERCENTAGE_ORDER_COUNT
-            FROM COMPANY_DW.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
-        """
-        return session.sql(query).to_pandas()
-    
+    # Execute data query (brand-specific dynamic table usage, 1 hour cache)
     try:
-        data = load_heavy_user_data(schema, table_prefix)
+        if FILTER_PUSHDOWN:
+            # Only the distinct menu/age group/gender values and date bounds are needed for the widgets
+            filter_options = run_query(session, "heavy_user_filter_options", schema, brand)
+            source_data = filter_options
+        else:
+            data = run_query(session, "heavy_user_summary", schema, brand)
+            source_data = data
         
-        if data.empty:
+        if source_data.empty:
             st.warning(f"{current_brand['title']} heavy user analysis data is not available.")
             return
             
@@ -53,16 +146,21 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         st.error(f"Error occurred while loading {current_brand['title']} heavy user analysis data: {e}")
         return
     
-    # Step 1: Convert 'ORDER_YMD' to pandas datetime format, then Korean format -> back to date format
-    data['ORDER_YMD'] = pd.to_datetime(data['ORDER_YMD'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
-    data['ORDER_YMD'] = pd.to_datetime(data['ORDER_YMD'], format='%Y-%m-%d')
-    
-    # Date slider/calendar settings
-    min_date = data['ORDER_YMD'].min().date()
-    max_date = data['ORDER_YMD'].max().date()
-    
-    # Extract menu list from actual data once (static usage)
-    static_menu_list = sorted(data["ITEM_NAME"].unique().tolist())
+    # ORDER_YMD (and MIN_/MAX_ORDER_YMD) arrive already parsed as dates from the query registry
+    if FILTER_PUSHDOWN:
+        # Date slider/calendar settings
+        min_date = filter_options['MIN_ORDER_YMD'].min().date()
+        max_date = filter_options['MAX_ORDER_YMD'].max().date()
+        
+        # Extract menu list from the distinct values once (static usage)
+        static_menu_list = sorted(filter_options["ITEM_NAME"].unique().tolist())
+    else:
+        # Date slider/calendar settings
+        min_date = data['ORDER_YMD'].min().date()
+        max_date = data['ORDER_YMD'].max().date()
+        
+        # Extract menu list from actual data once (static usage)
+        static_menu_list = sorted(data["ITEM_NAME"].unique().tolist())
     
     # Place filters in sidebar (static method like other pages)
     with top_placeholder.container():
@@ -110,20 +208,32 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Use selected dates directly (no session state modification)
     selected_dates = (start_date, end_date)
     
-    # Apply date filter
-    filtered_data = data[
-        (data['ORDER_YMD'] >= pd.Timestamp(selected_dates[0])) &
-        (data['ORDER_YMD'] <= pd.Timestamp(selected_dates[1]))
-    ]
-    
-    # Apply additional filtering - improved more stable method
-    if age_group != 'All':
-        filtered_data = filtered_data[filtered_data['AGE_GROUP'] == age_group]
-    if gender != 'All':
-        filtered_data = filtered_data[filtered_data['GENDER'] == gender]
+    if FILTER_PUSHDOWN:
+        # Menu list matching current filter (menus with data overlapping the selected period)
+        option_mask = (
+            (filter_options['MAX_ORDER_YMD'] >= pd.Timestamp(selected_dates[0])) &
+            (filter_options['MIN_ORDER_YMD'] <= pd.Timestamp(selected_dates[1]))
+        )
+        if age_group != 'All':
+            option_mask &= filter_options['AGE_GROUP'] == age_group
+        if gender != 'All':
+            option_mask &= filter_options['GENDER'] == gender
+        available_items = filter_options.loc[option_mask, "ITEM_NAME"].unique()
+    else:
+        # Apply date filter
+        filtered_data = data[
+            (data['ORDER_YMD'] >= pd.Timestamp(selected_dates[0])) &
+            (data['ORDER_YMD'] <= pd.Timestamp(selected_dates[1]))
+        ]
+        
+        # Apply additional filtering - improved more stable method
+        if age_group != 'All':
+            filtered_data = filtered_data[filtered_data['AGE_GROUP'] == age_group]
+        if gender != 'All':
+            filtered_data = filtered_data[filtered_data['GENDER'] == gender]
 
-    # Menu list matching current filter
-    available_items = filtered_data["ITEM_NAME"].unique()
+        # Menu list matching current filter
+        available_items = filtered_data["ITEM_NAME"].unique()
     
     # Check if selected menus are not in current filter
     invalid_selections = [item for item in selected_items if item not in available_items]
@@ -135,6 +245,22 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         st.warning(f"{current_brand['title']} No menus match the selected conditions.")
         return
     
+    if FILTER_PUSHDOWN:
+        # Load only the selected slice (filters are bound into the query, 1 hour cache per filter state).
+        # The menu selection stays in pandas: segment revenue and item options below read all menus.
+        # Runs async with a progress bar; a rerun (e.g., another filter change) cancels it in the warehouse.
+        try:
+            data = run_query_async(session, "heavy_user_summary_filtered", schema, brand, params={
+                'date_from': selected_dates[0].strftime('%Y%m%d'),
+                'date_to': selected_dates[1].strftime('%Y%m%d'),
+                'age_group': age_group,
+                'gender': gender,
+            })
+        except Exception as e:
+            st.error(f"Error occurred while loading {current_brand['title']} heavy user analysis data: {e}")
+            return
+        filtered_data = data
+    
     # Display current filtered data dataframe
     st.subheader(f"{current_brand['title']} Heavy User Analysis Data")
     
@@ -149,14 +275,20 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
     st.dataframe(filtered_data, use_container_width=True)
     
-    # CSV download
-    csv_data_heavy_user = data.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label=f"{current_brand['title']} Heavy User Full Data Download",
-        data=csv_data_heavy_user,
-        file_name=f'{current_brand["short"]}_heavy_user_data.csv',
-        mime='text/csv'
-    )
+    # Full data download (in pushdown mode the full history is exported by a background job)
+    if not FILTER_PUSHDOWN:
+        frame_download_button(
+            label=f"{current_brand['title']} Heavy User Full Data Download",
+            frame=data,
+            file_name=f'{current_brand["short"]}_heavy_user_data.csv',
+        )
+    else:
+        export_job_button(
+            f"Export {current_brand['title']} Heavy User Full Data",
+            session, "heavy_user_summary", schema, brand,
+            file_name=f'{current_brand["short"]}_heavy_user_data',
+            key="heavy_user_full_data_export",
+        )
     
     # Filter data for selected menus
     if selected_items:
@@ -169,14 +301,17 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         st.warning(f"{current_brand['title']} No data matches the selected conditions.")
         return
     
-    # Aggregate order quantities by age group and gender
-    gender_data = item_data.groupby(['ITEM_NAME', 'GENDER'])['TOTAL_ORDER_COUNT'].sum().reset_index()
-    if not gender_data.empty:
-        gender_data['PERCENTAGE'] = (gender_data['TOTAL_ORDER_COUNT'] / gender_data.groupby('ITEM_NAME')['TOTAL_ORDER_COUNT'].transform('sum')) * 100
+    # All chart aggregates in one pass, cached per filter state (unrelated reruns reuse them)
+    filter_state = (
+        schema, brand, FILTER_PUSHDOWN,
+        selected_dates[0].isoformat(), selected_dates[1].isoformat(),
+        age_group, gender, tuple(sorted(selected_items))
+    )
+    aggregates = build_menu_aggregates(filter_state, item_data)
     
-    age_data = item_data.groupby(['ITEM_NAME', 'AGE_GROUP'])['TOTAL_ORDER_COUNT'].sum().reset_index()
-    if not age_data.empty:
-        age_data['PERCENTAGE'] = (age_data['TOTAL_ORDER_COUNT'] / age_data.groupby('ITEM_NAME')['TOTAL_ORDER_COUNT'].transform('sum')) * 100
+    # Aggregate order quantities by age group and gender
+    gender_data = aggregates['gender_data']
+    age_data = aggregates['age_data']
     
     # Gender graph
     st.subheader(f"{current_brand['title']} Order Quantity by Gender")
@@ -228,9 +363,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
     # 1. Menu average order frequency analysis
     st.markdown("#### 📊 Menu Average Order Frequency")
-    order_frequency = item_data.groupby('ITEM_NAME')['TOTAL_ORDER_COUNT'].agg(['mean', 'sum', 'count']).reset_index()
-    order_frequency.columns = ['Menu Name', 'Average Order Quantity', 'Total Order Quantity', 'Customer Count']
-    order_frequency['Average Orders per Customer'] = order_frequency['Total Order Quantity'] / order_frequency['Customer Count']
+    order_frequency = aggregates['order_frequency']
     
     col1, col2 = st.columns(2)
     
@@ -251,8 +384,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # 2. Age group menu preference analysis
     with col2:
         st.markdown("#### 👥 Age Group Menu Preference Heatmap")
-        age_menu_pivot = item_data.groupby(['AGE_GROUP', 'ITEM_NAME'])['TOTAL_ORDER_COUNT'].sum().reset_index()
-        age_menu_matrix = age_menu_pivot.pivot(index='AGE_GROUP', columns='ITEM_NAME', values='TOTAL_ORDER_COUNT').fillna(0)
+        age_menu_matrix = aggregates['age_menu_matrix']
         
         fig_heatmap = px.imshow(
             age_menu_matrix,
@@ -265,8 +397,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
     # 3. Gender menu preference analysis
     st.markdown("#### 👫 Gender Menu Preference")
-    gender_menu_pivot = item_data.groupby(['GENDER', 'ITEM_NAME'])['TOTAL_ORDER_COUNT'].sum().reset_index()
-    gender_menu_matrix = gender_menu_pivot.pivot(index='GENDER', columns='ITEM_NAME', values='TOTAL_ORDER_COUNT').fillna(0)
+    gender_menu_matrix = aggregates['gender_menu_matrix']
     
     col1, col2 = st.columns(2)
     
@@ -284,23 +415,8 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     with col2:
         st.markdown("#### 🎯 Menu Customer Segmentation")
         
-        # Customer segmentation criteria definition
-        def categorize_customers(row):
-            if row['TOTAL_ORDER_COUNT'] >= 10:
-                return 'VIP Customer'
-            elif row['TOTAL_ORDER_COUNT'] >= 5:
-                return 'Heavy User'
-            elif row['TOTAL_ORDER_COUNT'] >= 2:
-                return 'Regular Customer'
-            else:
-                return 'New Customer'
-        
-        # Customer segmentation application
-        item_data_with_category = item_data.copy()
-        item_data_with_category['Customer_Segment'] = item_data_with_category.apply(categorize_customers, axis=1)
-        
-        # Segment distribution
-        customer_segments = item_data_with_category.groupby(['ITEM_NAME', 'Customer_Segment']).size().reset_index(name='CustomerCount')
+        # Segment distribution (VIP >= 10, Heavy >= 5, Regular >= 2 orders)
+        customer_segments = aggregates['customer_segments']
         
         fig_segments = px.bar(
             customer_segments,
@@ -316,16 +432,8 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # 5. Time-based order pattern analysis (date data utilization)
     st.markdown("#### 📅 Time-based Order Pattern")
     
-    # Daily order pattern
-    daily_orders = item_data.groupby('ORDER_YMD')['TOTAL_ORDER_COUNT'].sum().reset_index()
-    daily_orders['DayOfWeek'] = pd.to_datetime(daily_orders['ORDER_YMD']).dt.day_name()
-    daily_orders['Month'] = pd.to_datetime(daily_orders['ORDER_YMD']).dt.month
-    
-    # Daily average order quantity
-    weekday_avg = daily_orders.groupby('DayOfWeek')['TOTAL_ORDER_COUNT'].mean().reset_index()
-    weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    weekday_avg['DayOfWeek'] = pd.Categorical(weekday_avg['DayOfWeek'], categories=weekday_order, ordered=True)
-    weekday_avg = weekday_avg.sort_values('DayOfWeek')
+    # Daily average order quantity (from the daily order pattern)
+    weekday_avg = aggregates['weekday_avg']
     
     col1, col2 = st.columns(2)
     
@@ -344,23 +452,8 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     with col2:
         st.markdown("#### 💰 Menu Revenue Contribution Analysis")
         
-        # Create virtual revenue data (actual revenue column must exist)
-        item_data_with_revenue = item_data.copy()
-        # Set virtual price (actual DB must be used)
-        menu_prices = {
-            'Americano': 4500, 'Cafe Latte': 5000, 'Cappuccino': 5500, 'Espresso': 3500,
-            'Vanilla Latte': 6000, 'Caramel Macchiato': 6000, 'Mocha': 6500, 'Affogato': 7000
-        }
-        
-        # Menu price mapping (must be modified to match actual data)
-        item_data_with_revenue['Estimated_Unit_Price'] = item_data_with_revenue['ITEM_NAME'].map(
-            lambda x: menu_prices.get(x, 5000)  # Default value 5000 won
-        )
-        item_data_with_revenue['Estimated_Revenue'] = item_data_with_revenue['TOTAL_ORDER_COUNT'] * item_data_with_revenue['Estimated_Unit_Price']
-        
-        # Menu total revenue
-        menu_revenue = item_data_with_revenue.groupby('ITEM_NAME')['Estimated_Revenue'].sum().reset_index()
-        menu_revenue['Revenue_Ratio'] = (menu_revenue['Estimated_Revenue'] / menu_revenue['Estimated_Revenue'].sum()) * 100
+        # Menu total revenue (virtual prices, see MENU_PRICES)
+        menu_revenue = aggregates['menu_revenue']
         
         # Revenue pie chart
         fig_revenue = px.pie(
@@ -407,17 +500,19 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # 8. Additional analysis data download
     st.markdown("#### 📥 Detailed Analysis Data Download")
     
-    # Create comprehensive analysis data
+    # Create comprehensive analysis data (row-level estimated revenue, virtual prices)
+    item_data_with_revenue = item_data.copy()
+    item_data_with_revenue['Estimated_Unit_Price'] = item_data_with_revenue['ITEM_NAME'].astype(object).map(MENU_PRICES).fillna(DEFAULT_MENU_PRICE)
+    item_data_with_revenue['Estimated_Revenue'] = item_data_with_revenue['TOTAL_ORDER_COUNT'] * item_data_with_revenue['Estimated_Unit_Price']
+    
     comprehensive_data = item_data_with_revenue.merge(
         order_frequency, left_on='ITEM_NAME', right_on='Menu Name', how='left'
     )
     
-    csv_comprehensive = comprehensive_data.to_csv(index=False).encode('utf-8')
-    st.download_button(
+    frame_download_button(
         label=f"{current_brand['title']} Heavy User Detailed Analysis Data Download",
-        data=csv_comprehensive,
+        frame=comprehensive_data,
         file_name=f'{current_brand["short"]}_comprehensive_analysis_{selected_dates[0].strftime("%Y-%m-%d")}_{selected_dates[1].strftime("%Y-%m-%d")}.csv',
-        mime='text/csv'
     )
 
     # ITEM_NAME related logic here, then column name change
@@ -430,15 +525,15 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         key='menu_selection_2'
     )
 
-    # Column name change
-    filtered_data.columns = [
-        'Item Name', 
-        'Age Group', 
-        'Gender', 
-        'Order Date', 
-        'Total Order Quantity', 
-        'Percentage of Orders in the Same Age Group, Gender, and Date'
-    ]
+    # Column name change (new frame, so the loaded data keeps its original column names)
+    filtered_data = filtered_data.rename(columns={
+        'ITEM_NAME': 'Item Name', 
+        'AGE_GROUP': 'Age Group', 
+        'GENDER': 'Gender', 
+        'ORDER_YMD': 'Order Date', 
+        'TOTAL_ORDER_COUNT': 'Total Order Quantity', 
+        'PERCENTAGE_ORDER_COUNT': 'Percentage of Orders in the Same Age Group, Gender, and Date'
+    })
 
     # After column name change, use 'Item Name' column
     if not filtered_data.empty:
@@ -452,9 +547,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     else:
         st.warning(f'{current_brand["title"]} No data matches the selected conditions.')
 
-    # CSV download
-    csv_data = filtered_data.to_csv(index=False).encode('utf-8')
-    
+    # CSV download (serialized only when clicked)
     # CSS for customizing the button's size and color
     st.markdown(f"""
         <style>
@@ -477,11 +570,10 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Centering the button
     col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
-        st.download_button(
+        frame_download_button(
             label=f"{current_brand['title']} Selected Data Download",
-            data=csv_data,
+            frame=filtered_data,
             file_name=f'{current_brand["short"]}_data_{selected_dates[0].strftime("%Y-%m-%d")}_{selected_dates[1].strftime("%Y-%m-%d")}.csv',
-            mime='text/csv',
             key='download-button',
         )
 
@@ -527,9 +619,17 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Below part, selected_dates should be fetched from st.session_state
     # If needed, additional filtering logic should be performed here
     # Below is just an example, if no need to filter again, remove it
-    filtered_data_again = data[
-        (data['ORDER_YMD'] >= pd.Timestamp(selected_dates[0])) &
-        (data['ORDER_YMD'] <= pd.Timestamp(selected_dates[1]))
+    if FILTER_PUSHDOWN and (age_group != 'All' or gender != 'All'):
+        # The pushed-down slice is already age/gender filtered; this example is the date-only view
+        date_only_data = run_query(session, "heavy_user_summary_filtered", schema, brand, params={
+            'date_from': selected_dates[0].strftime('%Y%m%d'),
+            'date_to': selected_dates[1].strftime('%Y%m%d'),
+        })
+    else:
+        date_only_data = data
+    filtered_data_again = date_only_data[
+        (date_only_data['ORDER_YMD'] >= pd.Timestamp(selected_dates[0])) &
+        (date_only_data['ORDER_YMD'] <= pd.Timestamp(selected_dates[1]))
     ]
     st.write(f"{current_brand['title']} Re-filtered Data (Example):", filtered_data_again)
 
@@ -540,23 +640,11 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     st.subheader(f"🎯 {current_brand['title']} Customer Segment Revenue Contribution Analysis")
     
     # Calculate customer order frequency
-    customer_order_freq = filtered_data.groupby(['Age Group', 'Gender'])['Total Order Quantity'].sum().reset_index()
+    customer_order_freq = filtered_data.groupby(['Age Group', 'Gender'], observed=True)['Total Order Quantity'].sum().reset_index()
     customer_order_freq['AVG_ORDER_FREQ'] = customer_order_freq['Total Order Quantity'] / len(filtered_data)
     
-    # Customer segmentation criteria setting
-    freq_75 = customer_order_freq['AVG_ORDER_FREQ'].quantile(0.75)
-    freq_50 = customer_order_freq['AVG_ORDER_FREQ'].quantile(0.50)
-    
-    # Customer segment classification
-    def classify_customer_segment(freq):
-        if freq >= freq_75:
-            return 'VIP Customer'
-        elif freq >= freq_50:
-            return 'Heavy User'
-        else:
-            return 'Regular Customer'
-    
-    customer_order_freq['Customer_Segment'] = customer_order_freq['AVG_ORDER_FREQ'].apply(classify_customer_segment)
+    # Customer segment classification (VIP >= 75th percentile, Heavy User >= median)
+    customer_order_freq['Customer_Segment'] = assign_quantile_segments(customer_order_freq['AVG_ORDER_FREQ'])
     
     # Menu average price information
     menu_prices = {
@@ -736,10 +824,8 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # 6. Segment detailed data download
     st.markdown("#### 📥 Customer Segment Detailed Data Download")
     
-    csv_segment = segment_revenue_df.to_csv(index=False).encode('utf-8')
-    st.download_button(
+    frame_download_button(
         label=f"{current_brand['title']} Customer Segment Detailed Data Download",
-        data=csv_segment,
+        frame=segment_revenue_df,
         file_name=f'{current_brand["short"]}_customer_segment_analysis_{selected_dates[0].strftime("%Y-%m-%d")}_{selected_dates[1].strftime("%Y-%m-%d")}.csv',
-        mime='text/csv'
     ) 
\ No newline at end of file
@@ -2,11 +2,12 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 
+from query_registry import run_query
+
 def show_page(session, top_placeholder, month_options, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
     brand = brand or "TPC"
     schema = schema or f"ANALYSIS_{brand}"
-    table_prefix = f"DT_{brand}"
     
     # Brand-specific text mapping
     brand_texts = {
@@ -30,19 +31,6 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     # # Header for the page
     # st.header(f"{current_brand['title']} Heavy User Order Analysis")
 
-    # Cache menu list to avoid querying every time
-    @st.cache_data(ttl=3600)  # 1 hour cache
-    def get_menu_list(schema, table_prefix):
-        menu_query = f"""
-        SELECT DISTINCT ITEM_NAME 
-        FROM COMPANY_DW.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
-        ORDER BY ITEM_NAME
-        """
-        menu_data = session.sql(menu_query).to_pandas()
-        return menu_data['ITEM_NAME'].tolist()
-    
-    menu_list = get_menu_list(schema, table_prefix)
-
     # Initialize session state (execute only once)
     if 'heavy_user_filters' not in st.session_state:
         st.session_state.heavy_user_filters = {
@@ -95,6 +83,20 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
                 index=list(month_options.values()).index(st.session_state.heavy_user_filters['month_to'])
             )
         
+        # Extract the selected month key (e.g., '01', '10') from the dictionary
+        month_from_key = [key for key, value in month_options.items() if value == month_from][0]
+        month_to_key = [key for key, value in month_options.items() if value == month_to][0]
+        
+        # Single warehouse round trip: the selected period, projected to the columns the page uses (30 minute cache).
+        # Menu options and the age group/gender/menu filters are all derived locally from this slice.
+        period_data = run_query(session, "heavy_user_orders_slice", schema, brand, params={
+            'date_from': f"{year_from}{month_from_key}01",
+            'date_to': f"{year_to}{month_to_key}31",
+        })
+        
+        # Keep previously selected menus selectable even if they have no orders in the new period
+        menu_list = sorted(set(period_data['ITEM_NAME'].dropna()) | set(st.session_state.get('heavy_user_menu', [])))
+        
         # Additional filters: age group, gender
         col5, col6 = st.columns(2)
         
@@ -143,59 +145,26 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
         else:
             st.write("Selected menus: All")
 
-    # Extract the selected month key (e.g., '01', '10') from the dictionary
-    month_from_key = [key for key, value in month_options.items() if value == month_from][0]
-    month_to_key = [key for key, value in month_options.items() if value == month_to][0]
-    
     # Weekday order setting
     weekday_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     
-    # 1. Heavy user order data (include filter conditions in query)
-    # Basic query conditions
-    where_conditions = []
-    
-    # Date conditions
-    date_from = f"{year_from}{month_from_key}01"
-    date_to = f"{year_to}{month_to_key}31"
-    where_conditions.append(f"ORDER_YMD BETWEEN '{date_from}' AND '{date_to}'")
-    
-    # Age group conditions
+    # 1. Heavy user order data (age group/gender/menu filters applied locally to the period slice)
+    filter_mask = pd.Series(True, index=period_data.index)
     if age_group != 'All':
-        where_conditions.append(f"AGE_GROUP = '{age_group}'")
-    
-    # Gender conditions
+        filter_mask &= period_data['AGE_GROUP'] == age_group
     if gender != 'All':
-        where_conditions.append(f"GENDER = '{gender}'")
-    
-    # Menu conditions
+        filter_mask &= period_data['GENDER'] == gender
     if selected_menus:
-        menu_list_str = "', '".join(selected_menus)
-        where_conditions.append(f"ITEM_NAME IN ('{menu_list_str}')")
+        filter_mask &= period_data['ITEM_NAME'].isin(selected_menus)
     
-    # WHERE clause composition
-    where_clause = " AND ".join(where_conditions)
+    heavy_users_data = period_data[filter_mask].reset_index(drop=True)
     
-    # Cache data query to improve performance
-    @st.cache_data(ttl=1800)  # 30 minute cache
-    def get_heavy_users_data(schema, table_prefix, where_clause):
-        heavy_users_query = f"""
-        SELECT * FROM COMPANY_DW.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
-        WHERE {where_clause}
-        """
-        return session.sql(heavy_users_query).to_pandas()
+    # Age group and gender views share the same filtered rows
+    age_group_heavy_users_data = heavy_users_data[['ITEM_NAME', 'AGE_GROUP', 'GENDER', 'ORDER_YMD', 'TOTAL_ORDER_COUNT']].copy()
+    gender_heavy_users_data = age_group_heavy_users_data.sort_values('GENDER', kind='stable')
     
-    heavy_users_data = get_heavy_users_data(schema, table_prefix, where_clause)
-    
-    # Convert ORDER_YMD to 'YYYY-MM' format and create new column for sorting
-    heavy_users_data['ORDER_YMD'] = pd.to_datetime(heavy_users_data['ORDER_YMD'], format='%Y%m%d')
-    heavy_users_data['ORDER_MONTH_STR'] = heavy_users_data['ORDER_YMD'].dt.strftime('%Y-%m')
-    
-    # Extract weekday in English and map to English
-    weekday_mapping = {
-        "Monday": "Monday", "Tuesday": "Tuesday", "Wednesday": "Wednesday", 
-        "Thursday": "Thursday", "Friday": "Friday", "Saturday": "Saturday", "Sunday": "Sunday"
-    }
-    heavy_users_data['ORDER_WEEKDAY'] = heavy_users_data['ORDER_YMD'].dt.day_name().map(weekday_mapping)
+    # ORDER_YMD is parsed and ORDER_MONTH ('YYYY-MM') / ORDER_WEEKDAY (ordered category)
+    # are derived once by the cached loader (calendar dimension), not on every rerun
     
     # Streamlit Header
     st.header(f"{current_brand['title']} Heavy User Order Count (Monthly/Daily/Daily)")
@@ -205,8 +174,6 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     df_placeholder1 = st.empty()
     
     # Create daily/weekday heavy user order count graph
-    heavy_users_data['ORDER_WEEKDAY'] = pd.Categorical(heavy_users_data['ORDER_WEEKDAY'], categories=weekday_order, ordered=True)
-    
     weekday_color_map = {
         "Monday": "tomato",
         "Tuesday": "orange",
@@ -233,27 +200,27 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     # (1) First, group heavy_users_data by month+weekday and sum
     monthly_weekday_df = (
         heavy_users_data
-        .groupby(['ORDER_MONTH_STR', 'ORDER_WEEKDAY'], as_index=False)['TOTAL_ORDER_COUNT']
+        .groupby(['ORDER_MONTH', 'ORDER_WEEKDAY'], as_index=False, observed=True)['TOTAL_ORDER_COUNT']
         .sum()
     )
 
     monthly_chart = px.bar(
         monthly_weekday_df, 
-        x='ORDER_MONTH_STR', 
+        x='ORDER_MONTH', 
         y='TOTAL_ORDER_COUNT', 
         color='ORDER_WEEKDAY', 
         title=f"{current_brand['title']} Monthly/Weekday Heavy User Order Count",
-        labels={"ORDER_WEEKDAY": "Weekday", "TOTAL_ORDER_COUNT": "Order Count", "ORDER_MONTH_STR": "Month"},
+        labels={"ORDER_WEEKDAY": "Weekday", "TOTAL_ORDER_COUNT": "Order Count", "ORDER_MONTH": "Month"},
         color_discrete_map=weekday_color_map,  # (A) Hardcoded weekday color
         category_orders={
             "ORDER_WEEKDAY": weekday_order, 
-            "ORDER_MONTH_STR": sorted(monthly_weekday_df['ORDER_MONTH_STR'].unique())
+            "ORDER_MONTH": sorted(monthly_weekday_df['ORDER_MONTH'].unique())
         },
         text='TOTAL_ORDER_COUNT'  # Data column to display above bars
     )
     
     # (3) Monthly total (= sum of all weekdays) -> Annotation at top of graph
-    monthly_sums = monthly_weekday_df.groupby('ORDER_MONTH_STR')['TOTAL_ORDER_COUNT'].sum()
+    monthly_sums = monthly_weekday_df.groupby('ORDER_MONTH', observed=True)['TOTAL_ORDER_COUNT'].sum()
     
     for month_str, total_value in monthly_sums.items():
         monthly_chart.add_annotation(
@@ -294,7 +261,7 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     # (1) Sum "weekday" over entire period
     total_weekday_df = (
         heavy_users_data
-        .groupby('ORDER_WEEKDAY', as_index=False)['TOTAL_ORDER_COUNT']
+        .groupby('ORDER_WEEKDAY', as_index=False, observed=False)['TOTAL_ORDER_COUNT']
         .sum()
     )
 
@@ -331,32 +298,7 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     
     st.write(f"Selected period: {date_from} ~ {date_to}")
     
-    # Query to fetch data dynamically based on selected date range
-    age_group_where_conditions = []
-    age_group_where_conditions.append(f"ORDER_YMD BETWEEN '{date_from}01' AND '{date_to}31'")
-    
-    if age_group != 'All':
-        age_group_where_conditions.append(f"AGE_GROUP = '{age_group}'")
-    if gender != 'All':
-        age_group_where_conditions.append(f"GENDER = '{gender}'")
-    if selected_menus:
-        menu_list_str = "', '".join(selected_menus)
-        age_group_where_conditions.append(f"ITEM_NAME IN ('{menu_list_str}')")
-    
-    age_group_where_clause = " AND ".join(age_group_where_conditions)
-    
-    # Cache age group data query to improve performance
-    @st.cache_data(ttl=1800)  # 30 minute cache
-    def get_age_group_heavy_users_data(schema, table_prefix, age_group_where_clause):
-        age_group_heavy_users_query = f"""
-        SELECT * FROM COMPANY_DW.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
-        WHERE {age_group_where_clause}
-        """
-        return session.sql(age_group_heavy_users_query).to_pandas()
-    
-    age_group_heavy_users_data = get_age_group_heavy_users_data(schema, table_prefix, age_group_where_clause)
-    
-    aggregated_age_group_heavy_users_data = age_group_heavy_users_data.groupby('AGE_GROUP', as_index=False)['TOTAL_ORDER_COUNT'].sum()
+    aggregated_age_group_heavy_users_data = age_group_heavy_users_data.groupby('AGE_GROUP', as_index=False, observed=True)['TOTAL_ORDER_COUNT'].sum()
     # Plotly Bar Chart creation (age group)
     age_group_chart = px.bar(
         aggregated_age_group_heavy_users_data,
@@ -398,36 +340,10 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
     
     st.write(f"Selected period: {date_from} ~ {date_to}")
     
-    # Query to fetch data dynamically based on selected date range
-    gender_where_conditions = []
-    gender_where_conditions.append(f"ORDER_YMD BETWEEN '{date_from}01' AND '{date_to}31'")
-    
-    if age_group != 'All':
-        gender_where_conditions.append(f"AGE_GROUP = '{age_group}'")
-    if gender != 'All':
-        gender_where_conditions.append(f"GENDER = '{gender}'")
-    if selected_menus:
-        menu_list_str = "', '".join(selected_menus)
-        gender_where_conditions.append(f"ITEM_NAME IN ('{menu_list_str}')")
-    
-    gender_where_clause = " AND ".join(gender_where_conditions)
-    
-    # Cache gender data query to improve performance
-    @st.cache_data(ttl=1800)  # 30 minute cache
-    def get_gender_heavy_users_data(schema, table_prefix, gender_where_clause):
-        gender_heavy_users_query = f"""
-        SELECT * FROM COMPANY_DW.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
-        WHERE {gender_where_clause}
-        ORDER BY GENDER
-        """
-        return session.sql(gender_heavy_users_query).to_pandas()
-    
-    gender_heavy_users_data = get_gender_heavy_users_data(schema, table_prefix, gender_where_clause)
-    
     # 1) Sum data split by month by GENDER
     gender_agg_data = (
     gender_heavy_users_data
-        .groupby('GENDER', as_index=False)['TOTAL_ORDER_COUNT']
+        .groupby('GENDER', as_index=False, observed=True)['TOTAL_ORDER_COUNT']
         .sum()
     )
 
@@ -1,9 +1,10 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
 from datetime import datetime, date, time
-import io
+
+from hourly_sales_cube import get_hourly_sales_cube
+from data_export import frame_download_button
 
 def show_page(session, top_placeholder=None, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
@@ -55,35 +56,16 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
     
     # 1. First load data to secure filter options (new_subscribers.py method)
     try:
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_sales_data(schema, brand):
-            query = f"""
-            SELECT 
-                ADDR_CODE,
-                ITEM_NAME,
-                ORDER_TIMESTAMP,
-                ORDER_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_HOURLY_PRODUCT_SALES_BY_REGION
-            WHERE ORDER_TIMESTAMP IS NOT NULL
-            ORDER BY ORDER_TIMESTAMP, ADDR_CODE, ORDER_COUNT DESC
-            """
-            return session.sql(query).to_pandas()
-        
-        # Load data
-        raw_data = get_sales_data(schema, brand)
+        # Load the date x hour x region x product sales cube (built once per 30 minute cache refresh)
+        sales_cube = get_hourly_sales_cube(session, schema, brand)
         
-        if raw_data.empty:
+        if sales_cube.is_empty:
             st.warning("No data available. Please check the table.")
             return
         
-        # Data preprocessing
-        raw_data['ORDER_TIMESTAMP'] = pd.to_datetime(raw_data['ORDER_TIMESTAMP'])
-        raw_data['DATE'] = raw_data['ORDER_TIMESTAMP'].dt.date
-        raw_data['HOUR'] = raw_data['ORDER_TIMESTAMP'].dt.hour
-        
-        # Extract available options
-        available_regions = sorted(raw_data['ADDR_CODE'].unique())
-        available_products = sorted(raw_data['ITEM_NAME'].unique())
+        # Extract available options (cube dimensions are already sorted)
+        available_regions = sales_cube.regions
+        available_products = sales_cube.items
         
         # 2. Place all filters in top_placeholder.container()
         if top_placeholder:
@@ -164,27 +146,17 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
             key="hourly_product"
         )
         
-        # 3. Data filtering and deduplication
-        filtered_data = raw_data[
-            (raw_data['DATE'] >= start_date) & 
-            (raw_data['DATE'] <= end_date) &
-            (raw_data['HOUR'] >= start_hour) &
-            (raw_data['HOUR'] <= end_hour)
-        ].copy()
-        
-        if selected_region != "All":
-            filtered_data = filtered_data[filtered_data['ADDR_CODE'] == selected_region]
-        
-        # Remove duplicate data and verify
-        original_count = len(filtered_data)
-        filtered_data = filtered_data.drop_duplicates(subset=['ADDR_CODE', 'ITEM_NAME', 'ORDER_TIMESTAMP'])
-        deduplicated_count = len(filtered_data)
+        # 3. Data filtering: slice the cube (duplicates were removed once at load by the query registry)
+        filtered_sales = sales_cube.select(
+            start_date, end_date, start_hour, end_hour,
+            region=None if selected_region == "All" else selected_region
+        )
         
-        # Display deduplication results for debugging
-        if original_count != deduplicated_count:
-            st.warning(f"⚠️ {original_count - deduplicated_count} duplicate records removed. (Original: {original_count} → After cleanup: {deduplicated_count})")
+        # Data-quality metric recorded at load (not recomputed per rerun)
+        if sales_cube.duplicates_removed:
+            st.warning(f"⚠️ {sales_cube.duplicates_removed} duplicate records (same region, product and timestamp) were removed when loading the data.")
         
-        if filtered_data.empty:
+        if filtered_sales.total() == 0:
             st.warning("No data matches the selected conditions.")
             return
         
@@ -203,8 +175,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
             st.info(f"📍 **Region**: {region_text} | 📅 **Period**: {date_text} | ⏰ **Time Range**: {time_text}")
             
             # TOP 5 product aggregation
-            top5_data = filtered_data.groupby('ITEM_NAME')['ORDER_COUNT'].sum().reset_index()
-            top5_data = top5_data.sort_values('ORDER_COUNT', ascending=False).head(5)
+            top5_data = filtered_sales.item_totals().head(5)
             
             if not top5_data.empty:
                 # Display metrics
@@ -261,7 +232,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 st.subheader("📈 All Products Time-based Sales Trends")
                 
                 # Aggregate all products by time period
-                hourly_trend = filtered_data.groupby('HOUR')['ORDER_COUNT'].sum().reset_index()
+                hourly_trend = filtered_sales.hourly_totals()
                 
                 # Display metrics
                 col1, col2, col3, col4 = st.columns(4)
@@ -315,10 +286,10 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 st.subheader("📊 Popular Products Time-based Trend Comparison")
                 
                 # Extract TOP 5 products
-                top5_products = filtered_data.groupby('ITEM_NAME')['ORDER_COUNT'].sum().sort_values(ascending=False).head(5).index
+                top5_products = filtered_sales.item_totals().head(5)['ITEM_NAME'].tolist()
                 
                 # TOP 5 products time-based data
-                top5_hourly = filtered_data[filtered_data['ITEM_NAME'].isin(top5_products)].groupby(['HOUR', 'ITEM_NAME'])['ORDER_COUNT'].sum().reset_index()
+                top5_hourly = filtered_sales.hourly_by_items(top5_products)
                 
                 # Multi-line chart
                 fig_multi = px.line(
@@ -369,11 +340,9 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 st.subheader(f"📈 {selected_product} Time-based Sales Trends")
                 
                 # Aggregate selected product time-based data
-                product_data = filtered_data[filtered_data['ITEM_NAME'] == selected_product]
+                hourly_trend = filtered_sales.hourly_totals(item=selected_product)
                 
-                if not product_data.empty:
-                    # Time-based aggregation
-                    hourly_trend = product_data.groupby('HOUR')['ORDER_COUNT'].sum().reset_index()
+                if not hourly_trend.empty:
                     
                     # Display metrics
                     col1, col2, col3, col4 = st.columns(4)
@@ -427,7 +396,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                     if selected_region == "All":
                         st.subheader("🗺️ Regional Time-based Comparison")
                         
-                        regional_comparison = product_data.groupby(['ADDR_CODE', 'HOUR'])['ORDER_COUNT'].sum().reset_index()
+                        regional_comparison = filtered_sales.region_hourly(item=selected_product)
                         
                         fig_heatmap = px.density_heatmap(
                             regional_comparison,
@@ -473,29 +442,24 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         # Data download section
         st.subheader("💾 Data Download")
         
-        if st.button("📊 Download Filtered Data", type="secondary"):
-            if not filtered_data.empty:
-                csv_buffer = io.StringIO()
-                download_data = filtered_data.copy()
-                download_data['Date'] = download_data['DATE']
-                download_data['Time'] = download_data['HOUR']
-                download_data = download_data[['ADDR_CODE', 'ITEM_NAME', 'Date', 'Time', 'ORDER_COUNT']]
+        if filtered_sales.total() > 0:
+            def build_download_data():
+                # Rows are rebuilt from the non-empty cells of the selected slice (on click only)
+                download_data = filtered_sales.to_frame()[['ADDR_CODE', 'ITEM_NAME', 'DATE', 'HOUR', 'ORDER_COUNT']]
                 download_data.columns = ['Region', 'Product Name', 'Date', 'Time', 'Order Count']
-                download_data.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-                csv_data = csv_buffer.getvalue()
-                
-                current_datetime = datetime.now().strftime('%Y%m%d_%H%M')
-                filename = f"{current_brand['short']}_HourlyProductSales_{current_datetime}.csv"
-                
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=csv_data,
-                    file_name=filename,
-                    mime="text/csv",
-                    type="primary"
-                )
-            else:
-                st.warning("No data available for download.")
+                return download_data
+            
+            current_datetime = datetime.now().strftime('%Y%m%d_%H%M')
+            filename = f"{current_brand['short']}_HourlyProductSales_{current_datetime}.csv"
+            
+            frame_download_button(
+                label="📊 Download Filtered Data",
+                frame=build_download_data,
+                file_name=filename,
+                type="primary"
+            )
+        else:
+            st.warning("No data available for download.")
         
         # Marketing insights
         st.divider()
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from data_export import frame_download_button
+
 # Security utility import
 try:
     from security_utils import SecurityUtils
@@ -261,24 +263,18 @@ def show_page(session, top_placeholder, month_options, brand=None, schema=None,
         col1, col2 = st.columns(2)
         
         with col1:
-            if st.button("Download Daily Data"):
-                csv = daily_data.to_csv(index=False)
-                st.download_button(
-                    label="Download CSV",
-                    data=csv,
-                    file_name=f"{brand}_daily_new_subscribers.csv",
-                    mime="text/csv"
-                )
+            frame_download_button(
+                label="Download Daily Data",
+                frame=daily_data,
+                file_name=f"{brand}_daily_new_subscribers.csv",
+            )
         
         with col2:
-            if st.button("Download Detailed Data"):
-                csv = filtered_data.to_csv(index=False)
-                st.download_button(
-                    label="Download CSV",
-                    data=csv,
-                    file_name=f"{brand}_new_subscribers_detailed.csv",
-                    mime="text/csv"
-                )
+            frame_download_button(
+                label="Download Detailed Data",
+                frame=filtered_data,
+                file_name=f"{brand}_new_subscribers_detailed.csv",
+            )
         
         # Display data table
         st.subheader("📋 Data Table")
@@ -1,9 +1,104 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+import os
 import pandas as pd
-from datetime import datetime, timedelta
-import io
+import numpy as np
+from datetime import date, datetime, timedelta
+
+import hll_sketch
+from data_export import EXPORT_FORMATS
+from export_jobs import DONE, export_job_button
+from query_registry import derived_cache, run_query
+
+# Daily trend shows at most this many recent days
+DAILY_TREND_DAYS = 30
+WEEKLY_TREND_DAYS = 56  # 8 weeks
+
+# Default for the approximate (HyperLogLog) customer count toggle
+APPROXIMATE_COUNTS = os.getenv("NON_NEW_SIG_APPROXIMATE_COUNTS", "0") == "1"
+
+
+def split_metrics(metrics):
+    """
+    Split the single-scan non_new_sig_metrics result by grain
+
+    Args:
+        metrics (pd.DataFrame): GRAIN ('TOTAL' / 'DAY' / 'WEEK'), PERIOD_START,
+            CUSTOMER_COUNT, LATEST_DATE, EARLIEST_DATE
+
+    Returns:
+        tuple: (summary, daily, weekly) frames with the columns of the former
+            summary / daily trend / weekly trend queries
+    """
+    grain = metrics["GRAIN"]
+    summary = (
+        metrics.loc[grain == "TOTAL", ["CUSTOMER_COUNT", "LATEST_DATE", "EARLIEST_DATE"]]
+        .rename(columns={"CUSTOMER_COUNT": "TOTAL_CUSTOMERS"})
+        .reset_index(drop=True)
+    )
+    daily = (
+        metrics.loc[grain == "DAY", ["PERIOD_START", "CUSTOMER_COUNT"]]
+        .rename(columns={"PERIOD_START": "LAST_ORDER_DATE"})
+        .sort_values("LAST_ORDER_DATE", ascending=False)
+        .head(DAILY_TREND_DAYS)
+        .reset_index(drop=True)
+    )
+    weekly = (
+        metrics.loc[grain == "WEEK", ["PERIOD_START", "CUSTOMER_COUNT"]]
+        .rename(columns={"PERIOD_START": "WEEK_START"})
+        .sort_values("WEEK_START", ascending=False)
+        .reset_index(drop=True)
+    )
+    return summary, daily, weekly
+
+
+@derived_cache("non_new_sig_daily_sketches")
+@st.cache_data(ttl=1800, show_spinner=False)
+def build_approximate_metrics(schema, brand, today, _sketches):
+    """
+    Approximate non_new_sig_metrics from cached per-day HLL sketches
+
+    Daily counts come from each day's sketch; weekly and total counts union the
+    daily sketches locally (register-wise max), so no COUNT(DISTINCT) runs in
+    the warehouse. Windows match the exact query (30 days / 8 weeks from today).
+
+    Args:
+        schema, brand (str): Cache key for the sketch source
+        today (date): Cache key and window anchor
+        _sketches (pd.DataFrame): LAST_ORDER_DATE, UID_SKETCH (not hashed)
+
+    Returns:
+        pd.DataFrame: Same columns as non_new_sig_metrics, CUSTOMER_COUNT estimated
+    """
+    dates = pd.to_datetime(_sketches["LAST_ORDER_DATE"]).dt.normalize()
+    registers = hll_sketch.register_matrix(_sketches["UID_SKETCH"])
+    today = pd.Timestamp(today)
+
+    rows = [{
+        "GRAIN": "TOTAL",
+        "PERIOD_START": pd.NaT,
+        "CUSTOMER_COUNT": hll_sketch.estimate(registers.max(axis=0)) if len(registers) else 0.0,
+        "LATEST_DATE": dates.max(),
+        "EARLIEST_DATE": dates.min(),
+    }]
+
+    daily = (dates >= today - pd.Timedelta(days=DAILY_TREND_DAYS)).to_numpy()
+    for day, count in zip(dates[daily], hll_sketch.estimate(registers[daily]) if daily.any() else []):
+        rows.append({"GRAIN": "DAY", "PERIOD_START": day, "CUSTOMER_COUNT": count})
+
+    weekly = (dates >= today - pd.Timedelta(days=WEEKLY_TREND_DAYS)).to_numpy()
+    if weekly.any():
+        week_starts = dates[weekly] - pd.to_timedelta(dates[weekly].dt.weekday, unit="D")
+        codes, weeks = pd.factorize(week_starts, sort=True)
+        merged = hll_sketch.merge_groups(registers[weekly], codes, len(weeks))
+        for week, count in zip(weeks, hll_sketch.estimate(merged)):
+            rows.append({"GRAIN": "WEEK", "PERIOD_START": week, "CUSTOMER_COUNT": count})
+
+    metrics = pd.DataFrame(rows)
+    metrics["CUSTOMER_COUNT"] = np.rint(metrics["CUSTOMER_COUNT"]).astype("int64")
+    return metrics
+
 
 def show_page(session, top_placeholder=None, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
@@ -47,19 +142,28 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         """)
     
     try:
-        # 1. Summary metrics query
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_summary_metrics(schema, brand):
-            summary_query = f"""
-            SELECT 
-                COUNT(DISTINCT UID) as TOTAL_CUSTOMERS,
-                MAX(LAST_ORDER_DATE) as LATEST_DATE,
-                MIN(LAST_ORDER_DATE) as EARLIEST_DATE
-            FROM COMPANY_DW.{schema}.DT_{brand}_NON_NEW_SIG_CUSTOMERS
-            """
-            return session.sql(summary_query).to_pandas()
+        approximate = st.toggle(
+            "≈ Approximate customer counts (faster, HyperLogLog)",
+            value=APPROXIMATE_COUNTS,
+            key="non_new_sig_approximate_counts",
+            help="Estimates distinct customers from per-day sketches merged locally. "
+                 "Use when only the trend shape matters.",
+        )
+        
+        # 1. Summary metrics and daily/weekly trends from one table scan (30 minute cache)
+        if approximate:
+            sketches = run_query(session, "non_new_sig_daily_sketches", schema, brand)
+            metrics = build_approximate_metrics(schema, brand, date.today(), sketches)
+        else:
+            metrics = run_query(session, "non_new_sig_metrics", schema, brand)
+        summary_data, trend_data, weekly_data = split_metrics(metrics)
+        count_prefix = "≈ " if approximate else ""
         
-        summary_data = get_summary_metrics(schema, brand)
+        if approximate:
+            st.caption(
+                f"≈ Customer counts are HyperLogLog estimates "
+                f"(standard error about ±{hll_sketch.standard_error():.1%}); dates are exact."
+            )
         
         if summary_data.empty:
             st.warning("No data available. Please check the table.")
@@ -71,7 +175,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         with col1:
             st.metric(
                 label="📊 Total Target Customers",
-                value=f"{summary_data['TOTAL_CUSTOMERS'].iloc[0]:,} customers"
+                value=f"{count_prefix}{summary_data['TOTAL_CUSTOMERS'].iloc[0]:,} customers"
             )
         
         with col2:
@@ -93,22 +197,6 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         st.divider()
         
         # 3. Daily customer count trend chart
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_daily_trend(schema, brand):
-            trend_query = f"""
-            SELECT 
-                LAST_ORDER_DATE,
-                COUNT(DISTINCT UID) as CUSTOMER_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_NON_NEW_SIG_CUSTOMERS
-            WHERE LAST_ORDER_DATE >= CURRENT_DATE - 30
-            GROUP BY LAST_ORDER_DATE
-            ORDER BY LAST_ORDER_DATE DESC
-            LIMIT 30
-            """
-            return session.sql(trend_query).to_pandas()
-        
-        trend_data = get_daily_trend(schema, brand)
-        
         if not trend_data.empty:
             st.subheader("📈 Daily Target Customer Count Trend (Last 30 Days)")
             
@@ -124,7 +212,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 title=f"{current_brand['title']} New/Signature Non-Purchasing Customer Count Trend",
                 labels={
                     'LAST_ORDER_DATE': 'Last Order Date',
-                    'CUSTOMER_COUNT': 'Customer Count'
+                    'CUSTOMER_COUNT': f"{count_prefix}Customer Count"
                 }
             )
             
@@ -135,7 +223,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
             
             fig_line.update_layout(
                 xaxis_title="Last Order Date",
-                yaxis_title="Customer Count",
+                yaxis_title=f"{count_prefix}Customer Count",
                 hovermode='x unified',
                 showlegend=False
             )
@@ -150,14 +238,14 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 title=f"{current_brand['title']} New/Signature Non-Purchasing Customer Count (Bar Chart)",
                 labels={
                     'LAST_ORDER_DATE': 'Last Order Date',
-                    'CUSTOMER_COUNT': 'Customer Count'
+                    'CUSTOMER_COUNT': f"{count_prefix}Customer Count"
                 }
             )
             
             fig_bar.update_traces(marker_color='#4ECDC4')
             fig_bar.update_layout(
                 xaxis_title="Last Order Date",
-                yaxis_title="Customer Count",
+                yaxis_title=f"{count_prefix}Customer Count",
                 showlegend=False
             )
             
@@ -166,21 +254,6 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         st.divider()
         
         # 4. Weekly aggregation chart
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_weekly_trend(schema, brand):
-            weekly_query = f"""
-            SELECT 
-                DATE_TRUNC('WEEK', LAST_ORDER_DATE) as WEEK_START,
-                COUNT(DISTINCT UID) as CUSTOMER_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_NON_NEW_SIG_CUSTOMERS
-            WHERE LAST_ORDER_DATE >= CURRENT_DATE - 56  -- 8 weeks
-            GROUP BY DATE_TRUNC('WEEK', LAST_ORDER_DATE)
-            ORDER BY WEEK_START DESC
-            """
-            return session.sql(weekly_query).to_pandas()
-        
-        weekly_data = get_weekly_trend(schema, brand)
-        
         if not weekly_data.empty:
             st.subheader("📊 Weekly Target Customer Count (Last 8 Weeks)")
             
@@ -196,14 +269,14 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 title=f"{current_brand['title']} Weekly New/Signature Non-Purchasing Customer Count",
                 labels={
                     'WEEK_LABEL': 'Week',
-                    'CUSTOMER_COUNT': 'Customer Count'
+                    'CUSTOMER_COUNT': f"{count_prefix}Customer Count"
                 }
             )
             
             fig_weekly.update_traces(marker_color='#95E1D3')
             fig_weekly.update_layout(
                 xaxis_title="Week",
-                yaxis_title="Customer Count",
+                yaxis_title=f"{count_prefix}Customer Count",
                 xaxis_tickangle=-45,
                 showlegend=False
             )
@@ -215,45 +288,35 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         # 5. Data download section
         st.subheader("💾 Data Download")
         
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_full_customer_list(schema, brand):
-            full_query = f"""
-            SELECT 
-                UID as CustomerID,
-                LAST_ORDER_DATE as LastOrderDate
-            FROM COMPANY_DW.{schema}.DT_{brand}_NON_NEW_SIG_CUSTOMERS
-            ORDER BY LAST_ORDER_DATE DESC, UID
-            """
-            return session.sql(full_query).to_pandas()
+        current_date = datetime.now().strftime('%Y%m%d')
+        # Streams result batches to a file on a background worker (constant memory, no blocked reruns)
+        export_job = export_job_button(
+            "📋 Export Full Customer List",
+            session, "non_new_sig_customer_list", schema, brand,
+            file_name=f"{current_brand['short']}_NewSignature_NonPurchasingCustomers_{current_date}",
+            key="non_new_sig_export",
+            type="secondary",
+        )
         
-        if st.button("📋 View Full Customer List", type="secondary"):
-            with st.spinner("Loading data..."):
-                full_data = get_full_customer_list(schema, brand)
+        if export_job is not None and export_job.status == DONE:
+            if export_job.rows:
+                st.success(f"Retrieved {export_job.rows:,} customer records.")
+                
+                # Data preview
+                st.subheader("📋 Data Preview (Top 100)")
+                st.dataframe(export_job.preview, use_container_width=True)
                 
-                if not full_data.empty:
-                    st.success(f"Retrieved {len(full_data):,} customer records.")
-                    
-                    # Data preview
-                    st.subheader("📋 Data Preview (Top 100)")
-                    st.dataframe(full_data.head(100), use_container_width=True)
-                    
-                    # CSV download button
-                    csv_buffer = io.StringIO()
-                    full_data.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-                    csv_data = csv_buffer.getvalue()
-                    
-                    current_date = datetime.now().strftime('%Y%m%d')
-                    filename = f"{current_brand['short']}_NewSignature_NonPurchasingCustomers_{current_date}.csv"
-                    
-                    st.download_button(
-                        label="📥 Download CSV File",
-                        data=csv_data,
-                        file_name=filename,
-                        mime="text/csv",
-                        type="primary"
-                    )
-                else:
-                    st.warning("No data available for download.")
+                st.download_button(
+                    label=f"📥 Download {EXPORT_FORMATS[export_job.fmt].label} File",
+                    data=export_job.path.read_bytes,
+                    file_name=export_job.file_name,
+                    mime=EXPORT_FORMATS[export_job.fmt].mime,
+                    type="primary"
+                )
+            else:
+                st.warning("No data available for download.")
+        elif export_job is not None and export_job.is_active:
+            st.info(f"Export job {export_job.job_id} is {export_job.status}; it can be downloaded from the sidebar when complete.")
         
         # 6. Additional insights
         st.divider()
@@ -3,6 +3,9 @@ import plotly.express as px
 import pandas as pd
 import calendar
 
+from query_registry import run_query
+from data_export import frame_download_button
+
 def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
     brand = brand or "TPC"
@@ -60,23 +63,9 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     with tab1:
         st.subheader("📊 Regional Age Group Distribution")
         
-        # Load regional age group data
-        @st.cache_data(ttl=3600)  # 1 hour cache
-        def load_regional_age_data(schema, brand):
-            query = f"""
-            SELECT 
-                ADDR_CODE,
-                AGE_GROUP,
-                USER_COUNT,
-                MEMBER_COUNT,
-                TOTAL_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_AGE_GROUP_USERS
-            ORDER BY ADDR_CODE, AGE_GROUP
-            """
-            return session.sql(query).to_pandas()
-        
+        # Load regional age group data (1 hour cache)
         try:
-            regional_data = load_regional_age_data(schema, brand)
+            regional_data = run_query(session, "regional_age_users", schema, brand)
             
             if regional_data.empty:
                 st.warning("No regional age group data available.")
@@ -206,7 +195,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         
         try:
             if 'regional_data' not in locals():
-                regional_data = load_regional_age_data(schema, brand)
+                regional_data = run_query(session, "regional_age_users", schema, brand)
             
             if regional_data.empty:
                 st.warning("No data available for age group analysis.")
@@ -290,23 +279,9 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     with tab3:
         st.subheader("📈 Age Group Trend Analysis")
         
-        # Load trend data (if available)
-        @st.cache_data(ttl=3600)
-        def load_trend_data(schema, brand):
-            query = f"""
-            SELECT 
-                ORDER_DATE,
-                AGE_GROUP,
-                ADDR_CODE,
-                ORDER_COUNT,
-                USER_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_AGE_GROUP_TRENDS
-            ORDER BY ORDER_DATE, AGE_GROUP, ADDR_CODE
-            """
-            return session.sql(query).to_pandas()
-        
+        # Load trend data (if available, 1 hour cache)
         try:
-            trend_data = load_trend_data(schema, brand)
+            trend_data = run_query(session, "age_group_trends", schema, brand)
             
             if trend_data.empty:
                 st.info("No trend data available. This feature requires historical trend data.")
@@ -316,7 +291,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
                 
                 if 'regional_data' in locals() and not regional_data.empty:
                     # Age group summary
-                    age_summary = regional_data.groupby('AGE_GROUP').agg({
+                    age_summary = regional_data.groupby('AGE_GROUP', observed=True).agg({
                         'USER_COUNT': 'sum',
                         'MEMBER_COUNT': 'sum',
                         'TOTAL_COUNT': 'sum'
@@ -379,7 +354,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
             # Age group trend over time
             st.subheader("📈 Age Group Trend Over Time")
             
-            daily_trend = filtered_trend.groupby(['ORDER_DATE', 'AGE_GROUP'])['ORDER_COUNT'].sum().reset_index()
+            daily_trend = filtered_trend.groupby(['ORDER_DATE', 'AGE_GROUP'], observed=True)['ORDER_COUNT'].sum().reset_index()
             
             fig_trend = px.line(
                 daily_trend,
@@ -410,7 +385,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
             
             if selected_regions:
                 regional_trend = filtered_trend[filtered_trend['ADDR_CODE'].isin(selected_regions)]
-                regional_daily = regional_trend.groupby(['ORDER_DATE', 'ADDR_CODE'])['ORDER_COUNT'].sum().reset_index()
+                regional_daily = regional_trend.groupby(['ORDER_DATE', 'ADDR_CODE'], observed=True)['ORDER_COUNT'].sum().reset_index()
                 
                 fig_regional = px.line(
                     regional_daily,
@@ -430,7 +405,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
             # Trend summary statistics
             st.subheader("📊 Trend Summary Statistics")
             
-            trend_summary = filtered_trend.groupby('AGE_GROUP').agg({
+            trend_summary = filtered_trend.groupby('AGE_GROUP', observed=True).agg({
                 'ORDER_COUNT': ['sum', 'mean', 'std'],
                 'USER_COUNT': 'sum'
             }).reset_index()
@@ -449,12 +424,10 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
     try:
         if 'regional_data' in locals() and not regional_data.empty:
-            csv_data = regional_data.to_csv(index=False).encode('utf-8')
-            st.download_button(
+            frame_download_button(
                 label=f"{current_brand['title']} Regional Age Group Data Download",
-                data=csv_data,
+                frame=regional_data,
                 file_name=f'{current_brand["short"]}_regional_age_data.csv',
-                mime='text/csv'
             )
         else:
             st.warning("No data available for download.")
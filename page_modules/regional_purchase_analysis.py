@@ -5,6 +5,9 @@ import pandas as pd
 from datetime import datetime
 import io
 
+from query_registry import run_queries
+from data_export import frame_download_button
+
 def show_page(session, top_placeholder=None, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
     brand = brand or "TPC"
@@ -55,35 +58,13 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         """)
     
     try:
-        # 1. Purchase cycle data query
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_purchase_interval_data(schema, brand):
-            interval_query = f"""
-            SELECT 
-                ADDR_CODE,
-                USER_COUNT,
-                AVG_PURCHASE_INTERVAL
-            FROM COMPANY_DW.{schema}.DT_{brand}_PURCHASE_INTERVAL_BY_REGION
-            ORDER BY ADDR_CODE
-            """
-            return session.sql(interval_query).to_pandas()
-        
-        # 2. Popular products data query
-        @st.cache_data(ttl=1800)  # 30 minute cache
-        def get_top_products_data(schema, brand):
-            products_query = f"""
-            SELECT 
-                ADDR_CODE,
-                ITEM_NAME,
-                ORDER_COUNT
-            FROM COMPANY_DW.{schema}.DT_{brand}_TOP_PRODUCTS_BY_REGION
-            ORDER BY ADDR_CODE, ORDER_COUNT DESC
-            """
-            return session.sql(products_query).to_pandas()
-        
-        # Load data
-        interval_data = get_purchase_interval_data(schema, brand)
-        products_data = get_top_products_data(schema, brand)
+        # Load data concurrently (1. purchase cycle, 2. popular products - 30 minute cache)
+        results = run_queries(session, schema, brand, {
+            "interval": "purchase_interval_by_region",
+            "products": "top_products_by_region",
+        })
+        interval_data = results["interval"]
+        products_data = results["products"]
         
         if interval_data.empty and products_data.empty:
             st.warning("No data available. Please check the table.")
@@ -314,13 +295,13 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 st.subheader("🗺️ Regional Product Comparison")
                 
                 # Get TOP 5 products for all regions
-                all_top5 = products_data.groupby('ADDR_CODE').head(5)
+                all_top5 = products_data.groupby('ADDR_CODE', observed=True).head(5)
                 
                 # Create heatmap for TOP 5 products across regions
                 pivot_data = all_top5.pivot(index='ADDR_CODE', columns='ITEM_NAME', values='ORDER_COUNT').fillna(0)
                 
                 # Select only TOP 10 products across all regions for better visualization
-                top_products_all = products_data.groupby('ITEM_NAME')['ORDER_COUNT'].sum().sort_values(ascending=False).head(10).index
+                top_products_all = products_data.groupby('ITEM_NAME', observed=True)['ORDER_COUNT'].sum().sort_values(ascending=False).head(10).index
                 pivot_data_filtered = pivot_data[top_products_all]
                 
                 fig_heatmap = px.imshow(
@@ -336,7 +317,7 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
                 # Regional product diversity analysis
                 st.subheader("📊 Regional Product Diversity Analysis")
                 
-                diversity_data = products_data.groupby('ADDR_CODE').agg({
+                diversity_data = products_data.groupby('ADDR_CODE', observed=True).agg({
                     'ITEM_NAME': 'nunique',
                     'ORDER_COUNT': 'sum'
                 }).reset_index()
@@ -387,22 +368,18 @@ def show_page(session, top_placeholder=None, brand=None, schema=None, role=None)
         
         with col1:
             if not interval_data.empty:
-                csv_interval = interval_data.to_csv(index=False).encode('utf-8')
-                st.download_button(
+                frame_download_button(
                     label="📥 Download Purchase Cycle Data",
-                    data=csv_interval,
+                    frame=interval_data,
                     file_name=f'{current_brand["short"]}_purchase_cycle_data.csv',
-                    mime='text/csv'
                 )
         
         with col2:
             if not products_data.empty:
-                csv_products = products_data.to_csv(index=False).encode('utf-8')
-                st.download_button(
+                frame_download_button(
                     label="📥 Download Product Data",
-                    data=csv_products,
+                    frame=products_data,
                     file_name=f'{current_brand["short"]}_product_data.csv',
-                    mime='text/csv'
                 )
         
         # Marketing insights
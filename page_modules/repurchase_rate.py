@@ -3,11 +3,13 @@ import plotly.express as px
 import pandas as pd
 from datetime import date, timedelta
 
+from query_registry import run_queries, run_query
+from export_jobs import export_job_button
+
 def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     # Brand-specific dynamic query generation settings
     brand = brand or "TPC"
     schema = schema or f"ANALYSIS_{brand}"
-    table_prefix = f"DT_{brand}"
     
     # Brand-specific text mapping
     brand_texts = {
@@ -49,34 +51,22 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     
             # Use dynamic tables to query actual aggregated results for 2 or 3 week periods
             if window_option == "This Week Only":
-                query = f"""
-                SELECT YEAR, WEEK, ORDER_COUNT, USER_COUNT
-                FROM COMPANY_DW.{schema}.{table_prefix}_USER_WEEKLY_ORDER_DIST
-                WHERE YEAR = {year} AND WEEK = {week}
-                ORDER BY ORDER_COUNT
-                """
+                query_name = "user_weekly_order_dist"
+                query_params = {'year': int(year), 'week': int(week)}
             elif window_option == "2 Weeks (This Week + Previous 1 Week)":
                 # Calculate same as dynamic table aggregation (base date: 2000-01-01, 14-day units)
                 diff_days = (selected_date_dt - pd.to_datetime('2000-01-01')).days
                 mod_val = diff_days % 14
                 two_week_start = (selected_date_dt - pd.Timedelta(days=mod_val)).strftime('%Y-%m-%d')
-                query = f"""
-                SELECT YEAR, PERIOD_START, ORDER_COUNT, USER_COUNT
-                FROM COMPANY_DW.{schema}.{table_prefix}_USER_2WEEK_ORDER_DIST
-                WHERE PERIOD_START = TO_DATE('{two_week_start}', 'YYYY-MM-DD')
-                ORDER BY ORDER_COUNT
-                """
+                query_name = "user_2week_order_dist"
+                query_params = {'period_start': two_week_start}
             elif window_option == "3 Weeks (This Week + Previous 2 Weeks)":
                 # Calculate same as dynamic table aggregation (base date: 2000-01-01, 21-day units)
                 diff_days = (selected_date_dt - pd.to_datetime('2000-01-01')).days
                 mod_val = diff_days % 21
                 three_week_start = (selected_date_dt - pd.Timedelta(days=mod_val)).strftime('%Y-%m-%d')
-                query = f"""
-                SELECT YEAR, PERIOD_START, ORDER_COUNT, USER_COUNT
-                FROM COMPANY_DW.{schema}.{table_prefix}_USER_3WEEK_ORDER_DIST
-                WHERE PERIOD_START = TO_DATE('{three_week_start}', 'YYYY-MM-DD')
-                ORDER BY ORDER_COUNT
-                """
+                query_name = "user_3week_order_dist"
+                query_params = {'period_start': three_week_start}
         else:
             flg_year_or_not = True
             
@@ -85,24 +75,16 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
             month = st.sidebar.selectbox("Select month for analysis", list(range(1, 13)))
             st.write(f"Selected year: {sel_year}, Month: {month}")
     
-            query = f"""
-            SELECT YEAR, MON, ORDER_COUNT, USER_COUNT
-            FROM COMPANY_DW.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
-            WHERE YEAR = {sel_year} AND MON = {month}
-            ORDER BY ORDER_COUNT
-            """
-
-            query_year = f"""
-                SELECT MON, ORDER_COUNT, SUM(USER_COUNT) AS TOTAL_USER_COUNT
-                FROM COMPANY_DW.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
-                WHERE YEAR = {sel_year}
-                GROUP BY MON, ORDER_COUNT
-                ORDER BY MON, ORDER_COUNT
-            """
-            data_year = session.sql(query_year).to_pandas()
+            query_name = "user_monthly_order_dist"
+            query_params = {'year': int(sel_year), 'month': int(month)}
         
-        # Create Snowflake session and query data
-        data = session.sql(query).to_pandas()
+        # Query data through the registry (cached per period); the yearly view runs alongside
+        queries = {"period": (query_name, query_params)}
+        if flg_year_or_not:
+            queries["year"] = ("user_monthly_order_dist_year", {'year': int(sel_year)})
+        results = run_queries(session, schema, brand, queries)
+        data = results["period"]
+        data_year = results.get("year")
 
     if flg_year_or_not is True:
         # Monthly repurchase ratio graph (1, 2, 3 times)
@@ -238,11 +220,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         - **User Count**: Number of users with that order count  
         **Note**: Data with maximum order count (kiosk orders) can be viewed separately above.
         """)
-        download_query = f"""
-        SELECT YEAR, WEEK, ORDER_COUNT, USER_COUNT
-        FROM COMPANY_DW.{schema}.{table_prefix}_USER_WEEKLY_ORDER_DIST
-        ORDER BY YEAR, WEEK, ORDER_COUNT
-        """
+        download_query = "user_weekly_order_dist_all"
     else:
         st.write(f"""
         **Full Data Structure (for Monthly Analysis)**  
@@ -251,32 +229,28 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
         - **Order Count**: Number of orders by user in the month  
         - **User Count**: Number of users with that order count
         """)
-        download_query = f"""
-        SELECT YEAR, MON, ORDER_COUNT, USER_COUNT
-        FROM COMPANY_DW.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
-        ORDER BY YEAR, MON, ORDER_COUNT
-        """
-    download_data = session.sql(download_query).to_pandas()
+        download_query = "user_monthly_order_dist_all"
     if analysis_type == "Weekly":
-        download_data = download_data.rename(columns={
+        download_columns = {
             "YEAR": "Year",
             "WEEK": "Week",
             "ORDER_COUNT": "Order Count",
             "USER_COUNT": "User Count"
-        })
+        }
     else:
-        download_data = download_data.rename(columns={
+        download_columns = {
             "YEAR": "Year",
             "MON": "Month",
             "ORDER_COUNT": "Order Count",
             "USER_COUNT": "User Count"
-        })
-    csv_data = download_data.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label=f"{current_brand['title']} Full Data CSV Download",
-        data=csv_data,
-        file_name=f"{current_brand['short']}_FullData.csv",
-        mime="text/csv"
+        }
+    # Scans every distribution table, so it runs as a background job instead of on each rerun
+    export_job_button(
+        f"Export {current_brand['title']} Full Data",
+        session, download_query, schema, brand,
+        file_name=f"{current_brand['short']}_FullData",
+        rename=download_columns,
+        key="repurchase_full_data_export",
     )
 
     # ------------------------------------------------------------
@@ -288,12 +262,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
     st.header(f"{current_brand['title']} Store Menu Repurchase Ratio and TOP 5 Locations")
 
     # Query repurchase metrics data from dynamic table
-    repurchase_query = f"""
-    SELECT *
-    FROM COMPANY_DW.{schema}.{table_prefix}_REPURCHASE_METRICS
-    ORDER BY ORDER_DATE, STORE_NAME, ITEM_ID
-    """
-    repurchase_df = session.sql(repurchase_query).to_pandas()
+    repurchase_df = run_query(session, "repurchase_metrics", schema, brand)
 
     if repurchase_df.empty:
         st.warning("No repurchase metrics data available.")
@@ -318,7 +287,7 @@ def show_page(session, top_placeholder, brand=None, schema=None, role=None):
 
         # 3. TOP 5 locations (stores) from all data for selected order date - based on total order customer count
         date_filtered = repurchase_df[repurchase_df['ORDER_DATE'].dt.date == selected_date]
-        top5_stores = date_filtered.groupby("STORE_NAME")["TOTAL_CUSTOMERS"].sum().reset_index()
+        top5_stores = date_filtered.groupby("STORE_NAME", observed=True)["TOTAL_CUSTOMERS"].sum().reset_index()
         top5_stores = top5_stores.sort_values(by="TOTAL_CUSTOMERS", ascending=False).head(5)
 
         st.subheader(f"{current_brand['title']} TOP 5 Locations with Highest Order Count on {selected_date}")
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from data_export import frame_download_button
+
 # Security utility import
 try:
     from security_utils import SecurityUtils
@@ -296,34 +298,25 @@ def show_page(session, brand=None, schema=None, role=None):
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("📊 Download Category Summary"):
-            csv = comparison_display.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_category_summary.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📊 Download Category Summary",
+            frame=comparison_display,
+            file_name=f"{brand}_category_summary.csv",
+        )
     
     with col2:
-        if st.button("📈 Download Monthly Data"):
-            csv = monthly_sales.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_monthly_sales.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📈 Download Monthly Data",
+            frame=monthly_sales,
+            file_name=f"{brand}_monthly_sales.csv",
+        )
     
     with col3:
-        if st.button("📋 Download Full Dataset"):
-            csv = df_sales.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_sales_full_data.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📋 Download Full Dataset",
+            frame=df_sales,
+            file_name=f"{brand}_sales_full_data.csv",
+        )
     
     # Portfolio note
     st.markdown("""
@@ -1,11 +1,16 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+import os
+import zlib
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+from segmentation import USER_ACTIVITY_SEGMENTS
+from data_export import frame_download_button
+
 # Security utility import
 try:
     from security_utils import SecurityUtils
@@ -16,6 +21,18 @@ except ImportError:
         def log_data_access(user, data_type, record_count, ip_address=None):
             pass
 
+# Multiplier for the generated sample sizes (e.g., 100 for a ~10M-row load test)
+SAMPLE_DATA_SCALE = float(os.getenv("USER_SEGMENT_SAMPLE_SCALE", "1"))
+
+# Users per segment in the sample data: [low, high)
+SAMPLE_SEGMENT_SIZES = {
+    "Heavy Users": (8000, 12000),
+    "Regular Users": (25000, 35000),
+    "Light Users": (15000, 25000),
+    "Dormant Users": (20000, 30000),
+    "New Users": (5000, 10000),
+}
+
 # Portfolio sample data generation function
 def get_sample_user_counts_data():
     """Generate sample user count data for portfolio demonstration"""
@@ -25,56 +42,70 @@ def get_sample_user_counts_data():
         "Non-App Users": [87150]
     })
 
-def get_sample_mau_data():
-    """Generate sample MAU data with realistic patterns"""
+def _sample_rng(brand, dataset):
+    # crc32 (unlike hash()) is stable across processes, so every replica shows the same sample
+    return np.random.default_rng(zlib.crc32(f"{brand}:{dataset}".encode("utf-8")))
+
+@st.cache_data(show_spinner=False)
+def get_sample_mau_data(brand="BRAND_A", scale=1.0):
+    """
+    Generate sample MAU data with realistic patterns
+
+    Args:
+        brand (str): Brand code (seeds the generator; same brand, same data)
+        scale (float): Multiplier for the MAU counts
+
+    Returns:
+        pd.DataFrame: ORDER_MONTH, JOIN_WEEKDAY, MAU_COUNT (month x weekday)
+    """
     months = ['202401', '202402', '202403', '202404', '202405', '202406', 
               '202407', '202408', '202409', '202410', '202411', '202412']
     weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    rng = _sample_rng(brand, "mau")
     
-    data = []
-    for month in months:
-        # Generate realistic MAU patterns (higher on weekends, seasonal trends)
-        base_count = np.random.randint(8000, 15000)
-        
-        for weekday in weekdays:
-            # Weekend effect (higher MAU on weekends)
-            weekend_multiplier = 1.3 if weekday in ["Saturday", "Sunday"] else 1.0
-            count = int(base_count * weekend_multiplier * np.random.uniform(0.8, 1.2))
-            
-            data.append({
-                'ORDER_MONTH': month,
-                'JOIN_WEEKDAY': weekday,
-                'MAU_COUNT': count
-            })
-    
-    return pd.DataFrame(data)
+    # Generate realistic MAU patterns (higher on weekends, seasonal trends)
+    base_counts = rng.integers(8000, 15000, size=len(months))
+    # Weekend effect (higher MAU on weekends)
+    weekend_multiplier = np.where(np.isin(weekdays, ["Saturday", "Sunday"]), 1.3, 1.0)
+    noise = rng.uniform(0.8, 1.2, size=(len(months), len(weekdays)))
+    counts = (base_counts[:, None] * weekend_multiplier[None, :] * noise * scale).astype(np.int64)
+    
+    return pd.DataFrame({
+        'ORDER_MONTH': np.repeat(months, len(weekdays)),
+        'JOIN_WEEKDAY': np.tile(weekdays, len(months)),
+        'MAU_COUNT': counts.ravel()
+    })
+
+@st.cache_resource(show_spinner=False)
+def get_sample_user_segments_data(brand="BRAND_A", scale=1.0):
+    """
+    Generate sample user segment data (one row per user)
+
+    Shared between sessions without copying (~92k rows, ~9M at scale=100); treat as read-only.
+
+    Args:
+        brand (str): Brand code (seeds the generator; same brand, same data)
+        scale (float): Multiplier for the number of users per segment
 
-def get_sample_user_segments_data():
-    """Generate sample user segment data"""
-    segments = ["Heavy Users", "Regular Users", "Light Users", "Dormant Users", "New Users"]
-    
-    data = []
-    for i, segment in enumerate(segments):
-        # Generate realistic user counts per segment
-        if segment == "Heavy Users":
-            count = np.random.randint(8000, 12000)
-        elif segment == "Regular Users":
-            count = np.random.randint(25000, 35000)
-        elif segment == "Light Users":
-            count = np.random.randint(15000, 25000)
-        elif segment == "Dormant Users":
-            count = np.random.randint(20000, 30000)
-        else:  # New Users
-            count = np.random.randint(5000, 10000)
-        
-        # Create user IDs for the segment
-        for user_id in range(1, count + 1):
-            data.append({
-                'SEGMENT': segment,
-                'USERID': f"{segment[:3].upper()}{user_id:06d}"
-            })
-    
-    return pd.DataFrame(data)
+    Returns:
+        pd.DataFrame: SEGMENT (categorical), USERID
+    """
+    rng = _sample_rng(brand, "segments")
+    # Generate realistic user counts per segment
+    counts = np.array([
+        int(rng.integers(*SAMPLE_SEGMENT_SIZES.get(segment, (5000, 10000))) * scale)
+        for segment in USER_ACTIVITY_SEGMENTS
+    ])
+    
+    # Create user IDs for each segment: 3-letter prefix + zero-padded sequence
+    sequence = np.concatenate([np.arange(1, count + 1) for count in counts])
+    prefixes = np.repeat([segment[:3].upper() for segment in USER_ACTIVITY_SEGMENTS], counts)
+    user_ids = np.char.add(prefixes, np.char.zfill(sequence.astype(str), 6))
+    
+    return pd.DataFrame({
+        'SEGMENT': pd.Categorical.from_codes(np.repeat(np.arange(len(USER_ACTIVITY_SEGMENTS)), counts), USER_ACTIVITY_SEGMENTS),
+        'USERID': user_ids
+    })
 
 def show_page(session, brand=None, schema=None, role=None):
     # Brand-specific dynamic query configuration
@@ -140,7 +171,7 @@ def show_page(session, brand=None, schema=None, role=None):
     st.markdown("<br><br>", unsafe_allow_html=True)
     
     # 2. MAU Users (Monthly/Weekly)
-    mau_data = get_sample_mau_data()
+    mau_data = get_sample_mau_data(brand, SAMPLE_DATA_SCALE)
     
     # Convert ORDER_MONTH to 'YYYY-MM' format and create sorting column
     mau_data['ORDER_MONTH_STR'] = mau_data['ORDER_MONTH'].apply(lambda x: f"{str(x)[:4]}-{str(x)[4:]}")
@@ -241,13 +272,13 @@ def show_page(session, brand=None, schema=None, role=None):
     st.markdown("<br><br><br>", unsafe_allow_html = True)
     
     # User segment data - using sample data for portfolio
-    df_user_segments = get_sample_user_segments_data()
+    df_user_segments = get_sample_user_segments_data(brand, SAMPLE_DATA_SCALE)
     
     # 3. User segment status (color-coded visualization)
     st.header(f"{current_brand['title']} User Segment Status")
     st.markdown(f"""
     - **Analysis Purpose**: Analyze user behavior patterns and segment characteristics for {current_brand['title']}.
-    - **Segment Categories**: Heavy Users, Regular Users, Light Users, Dormant Users, New Users
+    - **Activity Segment Categories** (user lifecycle, distinct from the VIP/Heavy/Regular customer tiers): {', '.join(USER_ACTIVITY_SEGMENTS)}
     - **Business Value**: Enable targeted marketing and personalized service strategies.
     """)
     
@@ -305,34 +336,25 @@ def show_page(session, brand=None, schema=None, role=None):
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("📥 Download User Counts"):
-            csv = df_user_counts.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_user_counts.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📥 Download User Counts",
+            frame=df_user_counts,
+            file_name=f"{brand}_user_counts.csv",
+        )
     
     with col2:
-        if st.button("📥 Download MAU Data"):
-            csv = mau_data.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_mau_data.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📥 Download MAU Data",
+            frame=mau_data,
+            file_name=f"{brand}_mau_data.csv",
+        )
     
     with col3:
-        if st.button("📥 Download Segment Data"):
-            csv = segment_counts.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"{brand}_segment_summary.csv",
-                mime="text/csv"
-            )
+        frame_download_button(
+            label="📥 Download Segment Data",
+            frame=segment_counts,
+            file_name=f"{brand}_segment_summary.csv",
+        )
     
     # Portfolio note
     st.markdown("""
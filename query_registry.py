@@ -0,0 +1,1063 @@
+"""
+Central query registry for Tesla Portfolio Analytics Platform
+Named warehouse queries with declared columns, bind parameters and caching
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import snapshot_cache
+from calendar_dimension import CALENDAR_COLUMNS, add_calendar_columns, calendar_prefix
+from dtype_normalization import DATE_COLUMNS, normalize_frame
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# All brand schemas live in the same database; only schema/table prefix differ by brand
+DATABASE = "COMPANY_DW"
+
+# Watermark queries refresh with a delta query on TTL expiry instead of a full reload
+INCREMENTAL_REFRESH = os.getenv("QUERY_INCREMENTAL_REFRESH", "1") != "0"
+
+# Incremental results are still fully reloaded this often to pick up deletes/restatements
+FULL_REFRESH_SECONDS = int(os.getenv("QUERY_FULL_REFRESH_SECONDS", str(24 * 3600)))
+
+# How often async queries check for completion/cancellation (seconds)
+ASYNC_POLL_SECONDS = 0.5
+
+# Independent queries of one page run concurrently (bounded by the session pool size)
+QUERY_PARALLELISM = int(os.getenv("QUERY_PARALLELISM", "4"))
+
+# Results are shared between replicas (and deploys) through the disk snapshot cache
+SNAPSHOT_CACHE = os.getenv("QUERY_SNAPSHOT_CACHE", "1") != "0"
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    """
+    Declaration of a named dashboard query
+
+    Args:
+        name (str): Registry key used by pages
+        sql (str): SQL template. Identifiers use {database}/{schema}/{table_prefix}
+            placeholders, values use ? bind markers, optional filters use {filters}
+        columns (tuple): Columns the query is expected to return
+        params (tuple): Bind parameter names, in ? marker order
+        filters (tuple): Optional (param, column) filters rendered into {filters}
+            as "AND column = ?" or "AND column IN (?, ...)"; skipped when unset/'All'
+        ttl (int): Result cache TTL in seconds
+        freshness (str): How often the source table is refreshed
+        description (str): Short description for the admin page
+        normalize (bool): Apply dtype normalization (categories, int32 counts,
+            parsed ORDER_YMD/ORDER_TIMESTAMP) to the loaded result
+        calendar_column (str): Parsed date column to enrich with calendar attributes
+            (e.g., ORDER_YMD -> ORDER_MONTH, ORDER_WEEKDAY, ORDER_ISO_YEAR, ORDER_ISO_WEEK)
+        dedup_keys (tuple): Columns identifying a row; duplicates are dropped once at load
+            (first row kept, per the query's ORDER BY) and counted as a data-quality metric
+        watermark_column (str): Monotonic load column (ORDER_TIMESTAMP / ORDER_YMD). When set,
+            an expired result is refreshed by fetching only rows at or after
+            max(watermark) - late_arrival_window and merging them into the cached frame.
+            The SQL must contain {filters} so the delta predicate can be added
+        late_arrival_window (timedelta): How far behind the watermark rows may still arrive;
+            cached rows inside this window are replaced by the delta
+        memory_map (bool): Snapshot as Arrow IPC and serve the result from a read-only memory
+            map shared by all sessions and replicas on the host, instead of per-session copies
+    """
+    name: str
+    sql: str
+    columns: Tuple[str, ...] = ()
+    params: Tuple[str, ...] = ()
+    filters: Tuple[Tuple[str, str], ...] = ()
+    ttl: int = 1800
+    freshness: str = ""
+    description: str = ""
+    normalize: bool = True
+    calendar_column: Optional[str] = None
+    dedup_keys: Tuple[str, ...] = ()
+    watermark_column: Optional[str] = None
+    late_arrival_window: timedelta = field(default=timedelta(0))
+    memory_map: bool = False
+
+
+class QueryCancelled(Exception):
+    """An async warehouse query was cancelled (e.g., superseded by a script rerun)"""
+
+
+_QUERIES: Dict[str, QuerySpec] = {}
+_CACHED_RUNNERS: Dict[str, Any] = {}
+_DERIVED_CACHES: Dict[str, List[Any]] = {}
+_QUERY_STATS: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+# Identical concurrent warehouse queries (same SQL and binds) share one execution;
+# a cancelled leader does not fail the sessions waiting on it
+_in_flight = SingleFlight(retry_on=(QueryCancelled,))
+
+# Cancellation token of the run_query_async call running on this thread
+_async_state = threading.local()
+
+# Incrementally refreshed results: (name, schema, brand, params) -> _IncrementalEntry
+_INCREMENTAL: Dict[tuple, "_IncrementalEntry"] = {}
+_INCREMENTAL_LOCKS: Dict[tuple, threading.Lock] = {}
+_incremental_lock = threading.Lock()
+
+
+def register(spec):
+    """Register a query spec (names must be unique)"""
+    if spec.name in _QUERIES:
+        raise ValueError(f"Query '{spec.name}' is already registered")
+    if spec.watermark_column and "{filters}" not in spec.sql:
+        raise ValueError(f"Query '{spec.name}' has a watermark column but no {{filters}} placeholder")
+    _QUERIES[spec.name] = spec
+    return spec
+
+
+def get_query(name):
+    """Return the spec registered under name"""
+    try:
+        return _QUERIES[name]
+    except KeyError:
+        raise KeyError(f"Unknown query '{name}'. Registered: {', '.join(sorted(_QUERIES))}") from None
+
+
+def _is_unset(value):
+    return value is None or value == "All" or (isinstance(value, (list, tuple, set)) and len(value) == 0)
+
+
+def render_query(spec, schema, brand, params=None, since=None):
+    """
+    Build the SQL text and ordered bind values for a spec
+
+    Args:
+        spec (QuerySpec): Query to render
+        schema (str): Brand schema
+        brand (str): Brand key for the table prefix
+        params (dict): Bind/filter parameter values
+        since: Warehouse-format lower bound for spec.watermark_column (delta fetch)
+
+    Returns:
+        tuple: (sql, bind_values)
+    """
+    params = dict(params or {})
+    missing = [name for name in spec.params if name not in params]
+    if missing:
+        raise ValueError(f"Query '{spec.name}' is missing parameters: {', '.join(missing)}")
+
+    bind_values = [params[name] for name in spec.params]
+
+    # Optional filters are appended after the fixed parameters
+    filter_clauses = []
+    for param_name, column in spec.filters:
+        value = params.get(param_name)
+        if _is_unset(value):
+            continue
+        if isinstance(value, (list, tuple, set)):
+            values = sorted(value)
+            filter_clauses.append(f"AND {column} IN ({', '.join('?' for _ in values)})")
+            bind_values.extend(values)
+        else:
+            filter_clauses.append(f"AND {column} = ?")
+            bind_values.append(value)
+
+    if since is not None:
+        filter_clauses.append(f"AND {spec.watermark_column} >= ?")
+        bind_values.append(since)
+
+    sql = spec.sql.format(
+        database=DATABASE,
+        schema=schema,
+        table_prefix=f"DT_{brand}",
+        filters="\n".join(filter_clauses),
+    )
+    return sql, bind_values
+
+
+def _record_stats(name, elapsed_ms, rows, load="Full"):
+    with _stats_lock:
+        stats = _QUERY_STATS.setdefault(
+            name, {"executions": 0, "total_ms": 0.0, "last_ms": 0.0, "last_rows": 0, "duplicates_removed": 0}
+        )
+        stats["executions"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["last_ms"] = elapsed_ms
+        stats["last_rows"] = rows
+        stats["last_load"] = load
+
+
+def _drop_duplicates(spec, frame, load="Full"):
+    """
+    Drop duplicate rows by spec.dedup_keys and record how many were removed
+
+    Only full loads update the admin statistic: delta windows overlap from one
+    refresh to the next, and the merged result keeps the full load's count.
+    """
+    original_count = len(frame)
+    frame = frame.drop_duplicates(subset=list(spec.dedup_keys), ignore_index=True)
+    duplicates_removed = original_count - len(frame)
+
+    if load == "Full":
+        with _stats_lock:
+            _QUERY_STATS[spec.name]["duplicates_removed"] = duplicates_removed
+    if duplicates_removed:
+        logger.warning("query=%s removed %d duplicate rows (keys: %s)",
+                       spec.name, duplicates_removed, ", ".join(spec.dedup_keys))
+
+    # Travels with the cached result so pages can report data quality
+    frame.attrs["duplicates_removed"] = duplicates_removed
+    return frame
+
+
+def _record_shared(name):
+    with _stats_lock:
+        stats = _QUERY_STATS.setdefault(
+            name, {"executions": 0, "total_ms": 0.0, "last_ms": 0.0, "last_rows": 0, "duplicates_removed": 0}
+        )
+        stats["shared_waits"] = stats.get("shared_waits", 0) + 1
+
+
+def execute(session, spec, schema, brand, params=None, since=None):
+    """
+    Run a spec against the warehouse (no caching), with timing instrumentation
+
+    Concurrent calls rendering the same SQL and bind values (e.g., several sessions
+    missing the cache right after it expires) wait for one in-flight execution.
+    """
+    sql, bind_values = render_query(spec, schema, brand, params, since)
+    frame, shared = _in_flight.do(
+        (sql, tuple(bind_values)),
+        lambda: _execute(session, spec, schema, sql, bind_values, since),
+    )
+    if shared:
+        _record_shared(spec.name)
+        logger.info("query=%s schema=%s shared an in-flight execution", spec.name, schema)
+        # The leader keeps (and may cache or mutate) its frame
+        frame = frame.copy()
+    return frame
+
+
+def _submit_async(query):
+    """Start a query without blocking; None when the session has no async support"""
+    if hasattr(query, "to_pandas_async"):  # pooled session proxy
+        return query.to_pandas_async()
+    if hasattr(query, "collect_nowait"):  # Snowpark DataFrame
+        return query.to_pandas(block=False)
+    return None
+
+
+def _wait_for_job(spec, job, token):
+    """Poll an async job by query ID, cancelling it in the warehouse when the token is set"""
+    token.query_id = job.query_id
+    while not job.is_done():
+        if token.cancelled.wait(ASYNC_POLL_SECONDS):
+            job.cancel()
+            logger.info("query=%s query_id=%s cancelled", spec.name, job.query_id)
+            raise QueryCancelled(f"Query '{spec.name}' ({job.query_id}) was cancelled")
+    return job.result()
+
+
+def _execute(session, spec, schema, sql, bind_values, since):
+    start = time.perf_counter()
+    query = session.sql(sql, params=bind_values or None)
+    token = getattr(_async_state, "token", None)
+    job = _submit_async(query) if token is not None else None
+    frame = query.to_pandas() if job is None else _wait_for_job(spec, job, token)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    load = "Full" if since is None else "Delta"
+    _record_stats(spec.name, elapsed_ms, len(frame), load)
+    logger.info("query=%s schema=%s load=%s rows=%d elapsed_ms=%.1f",
+                spec.name, schema, load.lower(), len(frame), elapsed_ms)
+
+    missing_columns = [column for column in spec.columns if column not in frame.columns]
+    if missing_columns:
+        logger.warning("query=%s missing declared columns: %s", spec.name, missing_columns)
+
+    if spec.dedup_keys:
+        frame = _drop_duplicates(spec, frame, load)
+
+    if spec.normalize:
+        frame = normalize_frame(frame)
+
+    # Derived calendar columns are computed once here and cached with the result
+    if spec.calendar_column:
+        date_column = spec.calendar_column
+        if date_column in frame.columns and pd.api.types.is_datetime64_any_dtype(frame[date_column].dtype):
+            frame = add_calendar_columns(frame, date_column)
+        else:
+            logger.warning("query=%s calendar column %s is not a parsed date", spec.name, spec.calendar_column)
+    return frame
+
+
+def _record_snapshot_hit(name):
+    with _stats_lock:
+        stats = _QUERY_STATS.setdefault(
+            name, {"executions": 0, "total_ms": 0.0, "last_ms": 0.0, "last_rows": 0, "duplicates_removed": 0}
+        )
+        stats["snapshot_hits"] = stats.get("snapshot_hits", 0) + 1
+        stats["last_load"] = "Snapshot"
+
+
+def _load(session, spec, schema, brand, frozen_params, max_age=None):
+    """
+    Load a full result: a fresh disk snapshot if one exists, otherwise the warehouse
+
+    Args:
+        max_age (int): Oldest usable snapshot in seconds (default spec.ttl; 0 skips the snapshot)
+
+    Returns:
+        tuple: (DataFrame, epoch seconds the data was loaded from the warehouse)
+    """
+    key = snapshot_cache.snapshot_key(spec.name, schema, brand, frozen_params)
+    max_age = spec.ttl if max_age is None else max_age
+    if SNAPSHOT_CACHE and max_age > 0:
+        frame, created_at = snapshot_cache.load(key, max_age, _snapshot_format(spec))
+        if frame is not None:
+            _record_snapshot_hit(spec.name)
+            logger.info("query=%s schema=%s rows=%d served from snapshot", spec.name, schema, len(frame))
+            return frame, created_at
+
+    loaded_at = time.time()
+    frame = execute(session, spec, schema, brand, dict(frozen_params))
+    return _store_snapshot(spec, key, frame, loaded_at), loaded_at
+
+
+def _snapshot_format(spec):
+    return "arrow" if spec.memory_map else "parquet"
+
+
+def _store_snapshot(spec, key, frame, created_at):
+    """Write the snapshot; memory-mapped specs continue with the mapped frame"""
+    if not SNAPSHOT_CACHE:
+        return frame
+    fmt = _snapshot_format(spec)
+    if not snapshot_cache.store(key, frame, created_at, fmt) or not spec.memory_map:
+        return frame
+    # Drop the private copy in favour of the shared pages
+    mapped, _ = snapshot_cache.load(key, float("inf"), fmt)
+    return frame if mapped is None else mapped
+
+
+def _cached_runner(spec):
+    """
+    One cache function per spec so each query keeps its own TTL
+
+    Memory-mapped results use st.cache_resource so sessions share the mapped
+    frame instead of receiving the pickled copy st.cache_data would hand out.
+    """
+    runner = _CACHED_RUNNERS.get(spec.name)
+    if runner is None:
+        def run(_session, schema, brand, params):
+            frame, _ = _load(_session, spec, schema, brand, params)
+            return frame
+
+        # Streamlit keys caches by qualified name, so give each spec its own
+        run.__qualname__ = f"run_query.{spec.name}"
+        cache = st.cache_resource if spec.memory_map and SNAPSHOT_CACHE else st.cache_data
+        runner = cache(ttl=spec.ttl, show_spinner=False)(run)
+        _CACHED_RUNNERS[spec.name] = runner
+    return runner
+
+
+def freeze_params(params):
+    """Hashable, order-independent form of the params dict for cache keys"""
+    frozen = []
+    for key, value in sorted((params or {}).items()):
+        if isinstance(value, (list, set)):
+            value = tuple(sorted(value))
+        frozen.append((key, value))
+    return tuple(frozen)
+
+
+@dataclass
+class _IncrementalEntry:
+    frame: pd.DataFrame
+    watermark: Any
+    refreshed_at: float
+    full_loaded_at: float
+
+
+def _calendar_columns(spec):
+    if not spec.calendar_column:
+        return []
+    prefix = calendar_prefix(spec.calendar_column)
+    return [f"{prefix}_{column}" for column in CALENDAR_COLUMNS]
+
+
+def _watermark_bound(spec, cutoff):
+    """Delta lower bound in the warehouse's representation of the watermark column"""
+    date_format = DATE_COLUMNS.get(spec.watermark_column)
+    if date_format:
+        return cutoff.strftime(date_format)
+    # Keep sub-second precision: a truncated bound refetches rows that stay in the cache
+    return cutoff.isoformat(sep=" ")
+
+
+def _max_watermark(spec, frame):
+    column = spec.watermark_column
+    if column not in frame.columns or not pd.api.types.is_datetime64_any_dtype(frame[column].dtype):
+        return None
+    watermark = frame[column].max()
+    return None if pd.isna(watermark) else watermark
+
+
+def _merge_delta(spec, frame, delta, cutoff):
+    """Replace cached rows at/after cutoff with the delta rows"""
+    column = spec.watermark_column
+    calendar_columns = _calendar_columns(spec)
+
+    kept = frame.loc[frame[column] < cutoff]
+    merged = pd.concat(
+        [kept.drop(columns=calendar_columns, errors="ignore"), delta.drop(columns=calendar_columns, errors="ignore")],
+        ignore_index=True,
+    )
+    # Categories of the two parts differ, so concat falls back to object; restore compact dtypes
+    if spec.normalize:
+        merged = normalize_frame(merged)
+    if calendar_columns:
+        merged = add_calendar_columns(merged, spec.calendar_column)
+    # Delta windows overlap from one refresh to the next, so adding their duplicate
+    # counts would count the same rows again; keep the full load's figure
+    merged.attrs = dict(frame.attrs)
+    return merged
+
+
+def _run_incremental(session, spec, schema, brand, params):
+    """
+    Serve a watermark query from its incremental store
+
+    The first call (and every FULL_REFRESH_SECONDS) loads the full result. After
+    spec.ttl seconds only rows at or after max(watermark) - late_arrival_window
+    are fetched and merged, so an expired cache costs a small delta query. A result
+    without a watermark (empty, or an all-null column) is reloaded in full after
+    spec.ttl, like a query without incremental refresh.
+    """
+    frozen_params = freeze_params(params)
+    key = (spec.name, schema, brand, frozen_params)
+    with _incremental_lock:
+        key_lock = _INCREMENTAL_LOCKS.setdefault(key, threading.Lock())
+
+    with key_lock:
+        now = time.time()
+        entry = _INCREMENTAL.get(key)
+
+        if entry is None:
+            # On first use an older snapshot from another replica is a valid base for a
+            # delta (it counts as refreshed when written)
+            max_age = FULL_REFRESH_SECONDS
+        elif now - entry.full_loaded_at >= FULL_REFRESH_SECONDS:
+            max_age = 0  # a scheduled full refresh always goes to the warehouse
+        elif entry.watermark is None and now - entry.refreshed_at >= spec.ttl:
+            max_age = spec.ttl  # nothing to take a delta from; plain TTL reload
+        else:
+            max_age = None
+
+        if max_age is not None:
+            frame, loaded_at = _load(session, spec, schema, brand, frozen_params, max_age)
+            entry = _IncrementalEntry(frame, _max_watermark(spec, frame), loaded_at, now)
+            _INCREMENTAL[key] = entry
+
+        if entry.watermark is not None and now - entry.refreshed_at >= spec.ttl:
+            cutoff = entry.watermark - spec.late_arrival_window
+            if spec.watermark_column in DATE_COLUMNS and DATE_COLUMNS[spec.watermark_column]:
+                cutoff = cutoff.normalize()
+            delta = execute(session, spec, schema, brand, params, since=_watermark_bound(spec, cutoff))
+            frame = _merge_delta(spec, entry.frame, delta, cutoff)
+            logger.info("query=%s incremental refresh: delta_rows=%d total_rows=%d watermark=%s",
+                        spec.name, len(delta), len(frame), _max_watermark(spec, frame))
+            watermark = _max_watermark(spec, frame) or entry.watermark
+            frame = _store_snapshot(spec, snapshot_cache.snapshot_key(spec.name, schema, brand, frozen_params), frame, now)
+            entry = _IncrementalEntry(frame, watermark, now, entry.full_loaded_at)
+            _INCREMENTAL[key] = entry
+
+    # Same contract as st.cache_data (callers get their own copy), except that
+    # memory-mapped columns are shared read-only
+    return entry.frame.copy(deep=not (spec.memory_map and SNAPSHOT_CACHE))
+
+
+def run_query(session, name, schema, brand, params=None, cache=True):
+    """
+    Run a registered query and return a DataFrame
+
+    Args:
+        session: Snowpark session (or pooled session proxy)
+        name (str): Registered query name
+        schema (str): Brand schema, e.g. ANALYSIS_BRAND_A
+        brand (str): Brand key used for the DT_{brand} table prefix
+        params (dict): Bind/filter parameter values
+        cache (bool): Use the per-query cache (st.cache_data, or the incremental
+            store for queries with a watermark column)
+
+    Returns:
+        pd.DataFrame: Query result
+    """
+    spec = get_query(name)
+    if not cache:
+        return execute(session, spec, schema, brand, params)
+    if spec.watermark_column and INCREMENTAL_REFRESH:
+        return _run_incremental(session, spec, schema, brand, params)
+    frame = _cached_runner(spec)(session, schema, brand, freeze_params(params))
+    if spec.memory_map and SNAPSHOT_CACHE:
+        # Shared cached object: new columns go on the caller's shallow copy
+        return frame.copy(deep=False)
+    return frame
+
+
+def run_queries(session, schema, brand, queries, max_workers=None):
+    """
+    Run independent registered queries concurrently and wait for all of them
+
+    Page latency is bounded by the slowest query instead of the sum. Worker
+    threads carry the script run context, so caching behaves as in run_query.
+
+    Args:
+        session: Snowpark session (or pooled session proxy)
+        schema (str): Brand schema
+        brand (str): Brand key
+        queries (dict): Result key -> query name, or (query name, params)
+        max_workers (int): Thread limit (default QUERY_PARALLELISM)
+
+    Returns:
+        dict: Result key -> pd.DataFrame (first failure is re-raised after all finish)
+    """
+    requests = {
+        key: (request, None) if isinstance(request, str) else tuple(request)
+        for key, request in queries.items()
+    }
+    if len(requests) <= 1:
+        return {key: run_query(session, name, schema, brand, params) for key, (name, params) in requests.items()}
+
+    ctx = get_script_run_ctx()
+
+    def run(name, params):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return run_query(session, name, schema, brand, params)
+
+    workers = min(len(requests), max_workers or QUERY_PARALLELISM)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run_queries") as executor:
+        futures = {key: executor.submit(run, name, params) for key, (name, params) in requests.items()}
+        results = {}
+        errors = []
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors.append(e)
+
+    logger.info("run_queries queries=%s workers=%d elapsed_ms=%.1f",
+                [name for name, _ in requests.values()], workers, (time.perf_counter() - start) * 1000)
+    if errors:
+        raise errors[0]
+    return results
+
+
+class _CancelToken:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.query_id = None
+
+
+def _expected_seconds(name):
+    with _stats_lock:
+        stats = _QUERY_STATS.get(name, {})
+        if stats.get("executions"):
+            return stats["total_ms"] / stats["executions"] / 1000
+    return None
+
+
+def run_query_async(session, name, schema, brand, params=None, progress=None, cache=True):
+    """
+    Run a registered query off the script thread with a progress bar
+
+    The query is submitted asynchronously (Snowflake query ID) from a worker
+    thread while the script thread polls and updates the progress placeholder.
+    When a rerun or stop supersedes the script, the next placeholder update
+    raises; the warehouse query is then cancelled instead of running to
+    completion for nobody. Cache hits return without showing progress.
+
+    Args:
+        session: Snowpark session (or pooled session proxy)
+        name (str): Registered query name
+        schema (str): Brand schema
+        brand (str): Brand key
+        params (dict): Bind/filter parameter values
+        progress: Placeholder for the progress bar (default: a new st.empty())
+        cache (bool): Use the per-query cache, as in run_query
+
+    Returns:
+        pd.DataFrame: Query result
+    """
+    token = _CancelToken()
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _async_state.token = token
+        try:
+            return run_query(session, name, schema, brand, params, cache)
+        finally:
+            _async_state.token = None
+
+    placeholder = progress if progress is not None else st.empty()
+    expected = _expected_seconds(name)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run_query_async")
+    future = executor.submit(run)
+    start = time.perf_counter()
+    try:
+        while True:
+            done, _ = wait([future], timeout=ASYNC_POLL_SECONDS)
+            if done:
+                return future.result()
+            elapsed = time.perf_counter() - start
+            # No server-side progress is available; estimate from past executions
+            fraction = min(elapsed / expected, 0.95) if expected else min(elapsed / (elapsed + 30), 0.95)
+            query_id = f" · query ID {token.query_id}" if token.query_id else ""
+            placeholder.progress(fraction, text=f"Running {name}... {elapsed:.0f}s{query_id}")
+    except BaseException:
+        # Rerun/stop (or any failure) abandons the result: stop paying for the query
+        token.cancelled.set()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+        placeholder.empty()
+
+
+def derived_cache(*names):
+    """
+    Decorator registering a Streamlit-cached function built from query results
+
+    clear_cache() clears the function along with any of the named queries, so
+    values derived from a result (cubes, aggregates) are not served after it.
+
+    Args:
+        *names (str): Registered queries the cached values are computed from
+    """
+    def register_cache(cached_func):
+        for query_name in names:
+            _DERIVED_CACHES.setdefault(query_name, []).append(cached_func)
+        return cached_func
+    return register_cache
+
+
+def clear_cache(name=None):
+    """Clear cached results (memory and disk snapshots) for one query or all queries"""
+    names = [name] if name else list(_CACHED_RUNNERS.keys() | _DERIVED_CACHES.keys())
+    derived = []
+    for query_name in names:
+        runner = _CACHED_RUNNERS.get(query_name)
+        if runner is not None:
+            runner.clear()
+        derived.extend(func for func in _DERIVED_CACHES.get(query_name, []) if func not in derived)
+    for cached_func in derived:
+        cached_func.clear()
+
+    # The next call does a full reload
+    with _incremental_lock:
+        for key in list(_INCREMENTAL):
+            if name is None or key[0] == name:
+                _INCREMENTAL.pop(key, None)
+
+    if SNAPSHOT_CACHE:
+        snapshot_cache.clear(name)
+
+
+def describe_queries():
+    """Registry contents with execution statistics (admin page)"""
+    rows = []
+    with _stats_lock:
+        for spec in _QUERIES.values():
+            stats = _QUERY_STATS.get(spec.name, {})
+            executions = stats.get("executions", 0)
+            rows.append({
+                "Query": spec.name,
+                "Description": spec.description,
+                "Cache TTL (s)": spec.ttl,
+                "Freshness": spec.freshness,
+                "Warehouse Executions": executions,
+                "Avg ms": round(stats["total_ms"] / executions, 1) if executions else None,
+                "Snapshot Hits": stats.get("snapshot_hits", 0),
+                "Shared Waits": stats.get("shared_waits", 0),
+                "Last Rows": stats.get("last_rows"),
+                "Last Load": stats.get("last_load"),
+                "Duplicates Removed": stats.get("duplicates_removed") if spec.dedup_keys else None,
+            })
+    return pd.DataFrame(rows)
+
+
+# ------------------------
+# [Query catalog]
+# ------------------------
+
+# Heavy user analysis
+register(QuerySpec(
+    name="heavy_user_summary",
+    sql="""
+        SELECT
+            ITEM_NAME,
+            AGE_GROUP,
+            GENDER,
+            ORDER_YMD,
+            TOTAL_ORDER_COUNT,
+            PERCENTAGE_ORDER_COUNT
+        FROM {database}.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
+        WHERE 1 = 1
+        {filters}
+    """,
+    columns=("ITEM_NAME", "AGE_GROUP", "GENDER", "ORDER_YMD", "TOTAL_ORDER_COUNT", "PERCENTAGE_ORDER_COUNT"),
+    calendar_column="ORDER_YMD",
+    watermark_column="ORDER_YMD",
+    late_arrival_window=timedelta(days=2),
+    memory_map=True,
+    ttl=3600,
+    freshness="Daily",
+    description="Full heavy user summary (menu segmentation page)",
+))
+
+register(QuerySpec(
+    name="heavy_user_filter_options",
+    sql="""
+        SELECT
+            ITEM_NAME,
+            AGE_GROUP,
+            GENDER,
+            MIN(ORDER_YMD) AS MIN_ORDER_YMD,
+            MAX(ORDER_YMD) AS MAX_ORDER_YMD
+        FROM {database}.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
+        GROUP BY ITEM_NAME, AGE_GROUP, GENDER
+        ORDER BY ITEM_NAME
+    """,
+    columns=("ITEM_NAME", "AGE_GROUP", "GENDER", "MIN_ORDER_YMD", "MAX_ORDER_YMD"),
+    ttl=3600,
+    freshness="Daily",
+    description="Distinct menu/age/gender values and date bounds for filter widgets",
+))
+
+register(QuerySpec(
+    name="heavy_user_summary_filtered",
+    sql="""
+        SELECT
+            ITEM_NAME,
+            AGE_GROUP,
+            GENDER,
+            ORDER_YMD,
+            TOTAL_ORDER_COUNT,
+            PERCENTAGE_ORDER_COUNT
+        FROM {database}.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
+        WHERE ORDER_YMD BETWEEN ? AND ?
+        {filters}
+    """,
+    columns=("ITEM_NAME", "AGE_GROUP", "GENDER", "ORDER_YMD", "TOTAL_ORDER_COUNT", "PERCENTAGE_ORDER_COUNT"),
+    params=("date_from", "date_to"),
+    filters=(("age_group", "AGE_GROUP"), ("gender", "GENDER")),
+    calendar_column="ORDER_YMD",
+    ttl=3600,
+    freshness="Daily",
+    description="Heavy user summary with date/age/gender filters pushed down",
+))
+
+register(QuerySpec(
+    name="heavy_user_orders_slice",
+    sql="""
+        SELECT
+            ITEM_NAME,
+            AGE_GROUP,
+            GENDER,
+            ORDER_YMD,
+            TOTAL_ORDER_COUNT
+        FROM {database}.{schema}.{table_prefix}_HEAVY_USER_ANALYSIS_SUMMARY
+        WHERE ORDER_YMD BETWEEN ? AND ?
+    """,
+    columns=("ITEM_NAME", "AGE_GROUP", "GENDER", "ORDER_YMD", "TOTAL_ORDER_COUNT"),
+    params=("date_from", "date_to"),
+    calendar_column="ORDER_YMD",
+    ttl=1800,
+    freshness="Daily",
+    description="Heavy user orders for a date range (menu/age/gender views derived locally)",
+))
+
+# Hourly regional product sales
+register(QuerySpec(
+    name="hourly_product_sales",
+    sql="""
+        SELECT
+            ADDR_CODE,
+            ITEM_NAME,
+            ORDER_TIMESTAMP,
+            ORDER_COUNT
+        FROM {database}.{schema}.{table_prefix}_HOURLY_PRODUCT_SALES_BY_REGION
+        WHERE ORDER_TIMESTAMP IS NOT NULL
+        {filters}
+        ORDER BY ORDER_TIMESTAMP, ADDR_CODE, ORDER_COUNT DESC
+    """,
+    columns=("ADDR_CODE", "ITEM_NAME", "ORDER_TIMESTAMP", "ORDER_COUNT"),
+    dedup_keys=("ADDR_CODE", "ITEM_NAME", "ORDER_TIMESTAMP"),
+    watermark_column="ORDER_TIMESTAMP",
+    late_arrival_window=timedelta(hours=6),
+    memory_map=True,
+    ttl=1800,
+    freshness="Hourly",
+    description="Hourly product sales by region",
+))
+
+# Non-new/signature purchase customers
+register(QuerySpec(
+    name="non_new_sig_metrics",
+    sql="""
+        SELECT
+            CASE
+                WHEN GROUPING(DAY_KEY) = 0 THEN 'DAY'
+                WHEN GROUPING(WEEK_KEY) = 0 THEN 'WEEK'
+                ELSE 'TOTAL'
+            END as GRAIN,
+            COALESCE(DAY_KEY, WEEK_KEY) as PERIOD_START,
+            COUNT(DISTINCT UID) as CUSTOMER_COUNT,
+            MAX(LAST_ORDER_DATE) as LATEST_DATE,
+            MIN(LAST_ORDER_DATE) as EARLIEST_DATE
+        FROM (
+            SELECT
+                UID,
+                LAST_ORDER_DATE,
+                CASE WHEN LAST_ORDER_DATE >= CURRENT_DATE - 30
+                    THEN LAST_ORDER_DATE END as DAY_KEY,
+                CASE WHEN LAST_ORDER_DATE >= CURRENT_DATE - 56  -- 8 weeks
+                    THEN DATE_TRUNC('WEEK', LAST_ORDER_DATE) END as WEEK_KEY
+            FROM {database}.{schema}.{table_prefix}_NON_NEW_SIG_CUSTOMERS
+        )
+        GROUP BY GROUPING SETS ((), (DAY_KEY), (WEEK_KEY))
+        -- Drop the groups of rows outside the daily/weekly windows (NULL keys)
+        HAVING GROUPING(DAY_KEY, WEEK_KEY) = 3 OR COALESCE(DAY_KEY, WEEK_KEY) IS NOT NULL
+        ORDER BY GRAIN, PERIOD_START DESC
+    """,
+    columns=("GRAIN", "PERIOD_START", "CUSTOMER_COUNT", "LATEST_DATE", "EARLIEST_DATE"),
+    ttl=1800,
+    freshness="Daily",
+    description="Non-new/signature summary, daily (30 days) and weekly (8 weeks) counts in one scan",
+))
+
+register(QuerySpec(
+    name="non_new_sig_daily_sketches",
+    sql="""
+        SELECT
+            LAST_ORDER_DATE,
+            HLL_EXPORT(HLL_ACCUMULATE(UID)) as UID_SKETCH
+        FROM {database}.{schema}.{table_prefix}_NON_NEW_SIG_CUSTOMERS
+        GROUP BY LAST_ORDER_DATE
+        ORDER BY LAST_ORDER_DATE
+    """,
+    columns=("LAST_ORDER_DATE", "UID_SKETCH"),
+    ttl=1800,
+    freshness="Daily",
+    description="Per-day HLL sketches of non-new/signature customers (approximate mode)",
+))
+
+register(QuerySpec(
+    name="non_new_sig_customer_list",
+    sql="""
+        SELECT
+            UID as CustomerID,
+            LAST_ORDER_DATE as LastOrderDate
+        FROM {database}.{schema}.{table_prefix}_NON_NEW_SIG_CUSTOMERS
+        ORDER BY LAST_ORDER_DATE DESC, UID
+    """,
+    columns=("CUSTOMERID", "LASTORDERDATE"),
+    ttl=1800,
+    freshness="Daily",
+    description="Full non-new/signature customer list",
+))
+
+# Regional age data
+register(QuerySpec(
+    name="regional_age_users",
+    sql="""
+        SELECT
+            ADDR_CODE,
+            AGE_GROUP,
+            USER_COUNT,
+            MEMBER_COUNT,
+            TOTAL_COUNT
+        FROM {database}.{schema}.{table_prefix}_AGE_GROUP_USERS
+        ORDER BY ADDR_CODE, AGE_GROUP
+    """,
+    columns=("ADDR_CODE", "AGE_GROUP", "USER_COUNT", "MEMBER_COUNT", "TOTAL_COUNT"),
+    ttl=3600,
+    freshness="Daily",
+    description="Users by region and age group",
+))
+
+register(QuerySpec(
+    name="age_group_trends",
+    sql="""
+        SELECT
+            ORDER_DATE,
+            AGE_GROUP,
+            ADDR_CODE,
+            ORDER_COUNT,
+            USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_AGE_GROUP_TRENDS
+        ORDER BY ORDER_DATE, AGE_GROUP, ADDR_CODE
+    """,
+    columns=("ORDER_DATE", "AGE_GROUP", "ADDR_CODE", "ORDER_COUNT", "USER_COUNT"),
+    ttl=3600,
+    freshness="Daily",
+    description="Age group order trends by region",
+))
+
+# Regional purchase cycle and key products
+register(QuerySpec(
+    name="purchase_interval_by_region",
+    sql="""
+        SELECT
+            ADDR_CODE,
+            USER_COUNT,
+            AVG_PURCHASE_INTERVAL
+        FROM {database}.{schema}.{table_prefix}_PURCHASE_INTERVAL_BY_REGION
+        ORDER BY ADDR_CODE
+    """,
+    columns=("ADDR_CODE", "USER_COUNT", "AVG_PURCHASE_INTERVAL"),
+    ttl=1800,
+    freshness="Daily",
+    description="Average purchase interval by region",
+))
+
+register(QuerySpec(
+    name="top_products_by_region",
+    sql="""
+        SELECT
+            ADDR_CODE,
+            ITEM_NAME,
+            ORDER_COUNT
+        FROM {database}.{schema}.{table_prefix}_TOP_PRODUCTS_BY_REGION
+        ORDER BY ADDR_CODE, ORDER_COUNT DESC
+    """,
+    columns=("ADDR_CODE", "ITEM_NAME", "ORDER_COUNT"),
+    ttl=1800,
+    freshness="Daily",
+    description="Top products by region",
+))
+
+# Repurchase rate
+register(QuerySpec(
+    name="user_weekly_order_dist",
+    sql="""
+        SELECT YEAR, WEEK, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_WEEKLY_ORDER_DIST
+        WHERE YEAR = ? AND WEEK = ?
+        ORDER BY ORDER_COUNT
+    """,
+    columns=("YEAR", "WEEK", "ORDER_COUNT", "USER_COUNT"),
+    params=("year", "week"),
+    ttl=1800,
+    freshness="Daily",
+    description="Order count distribution for one ISO week",
+))
+
+register(QuerySpec(
+    name="user_2week_order_dist",
+    sql="""
+        SELECT YEAR, PERIOD_START, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_2WEEK_ORDER_DIST
+        WHERE PERIOD_START = TO_DATE(?, 'YYYY-MM-DD')
+        ORDER BY ORDER_COUNT
+    """,
+    columns=("YEAR", "PERIOD_START", "ORDER_COUNT", "USER_COUNT"),
+    params=("period_start",),
+    ttl=1800,
+    freshness="Daily",
+    description="Order count distribution for a 2-week period",
+))
+
+register(QuerySpec(
+    name="user_3week_order_dist",
+    sql="""
+        SELECT YEAR, PERIOD_START, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_3WEEK_ORDER_DIST
+        WHERE PERIOD_START = TO_DATE(?, 'YYYY-MM-DD')
+        ORDER BY ORDER_COUNT
+    """,
+    columns=("YEAR", "PERIOD_START", "ORDER_COUNT", "USER_COUNT"),
+    params=("period_start",),
+    ttl=1800,
+    freshness="Daily",
+    description="Order count distribution for a 3-week period",
+))
+
+register(QuerySpec(
+    name="user_monthly_order_dist",
+    sql="""
+        SELECT YEAR, MON, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
+        WHERE YEAR = ? AND MON = ?
+        ORDER BY ORDER_COUNT
+    """,
+    columns=("YEAR", "MON", "ORDER_COUNT", "USER_COUNT"),
+    params=("year", "month"),
+    ttl=1800,
+    freshness="Daily",
+    description="Order count distribution for one month",
+))
+
+register(QuerySpec(
+    name="user_monthly_order_dist_year",
+    sql="""
+        SELECT MON, ORDER_COUNT, SUM(USER_COUNT) AS TOTAL_USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
+        WHERE YEAR = ?
+        GROUP BY MON, ORDER_COUNT
+        ORDER BY MON, ORDER_COUNT
+    """,
+    columns=("MON", "ORDER_COUNT", "TOTAL_USER_COUNT"),
+    params=("year",),
+    ttl=1800,
+    freshness="Daily",
+    description="Monthly order count distribution for a year",
+))
+
+register(QuerySpec(
+    name="user_weekly_order_dist_all",
+    sql="""
+        SELECT YEAR, WEEK, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_WEEKLY_ORDER_DIST
+        ORDER BY YEAR, WEEK, ORDER_COUNT
+    """,
+    columns=("YEAR", "WEEK", "ORDER_COUNT", "USER_COUNT"),
+    ttl=1800,
+    freshness="Daily",
+    description="Full weekly order count distribution (download)",
+))
+
+register(QuerySpec(
+    name="user_monthly_order_dist_all",
+    sql="""
+        SELECT YEAR, MON, ORDER_COUNT, USER_COUNT
+        FROM {database}.{schema}.{table_prefix}_USER_MONTHLY_ORDER_DIST
+        ORDER BY YEAR, MON, ORDER_COUNT
+    """,
+    columns=("YEAR", "MON", "ORDER_COUNT", "USER_COUNT"),
+    ttl=1800,
+    freshness="Daily",
+    description="Full monthly order count distribution (download)",
+))
+
+register(QuerySpec(
+    name="repurchase_metrics",
+    sql="""
+        SELECT *
+        FROM {database}.{schema}.{table_prefix}_REPURCHASE_METRICS
+        ORDER BY ORDER_DATE, STORE_NAME, ITEM_ID
+    """,
+    columns=("ORDER_DATE", "STORE_NAME", "ITEM_NAME", "TOTAL_CUSTOMERS",
+             "REPURCHASE_RATE_7", "REPURCHASE_RATE_14", "REPURCHASE_RATE_30"),
+    ttl=1800,
+    freshness="Daily",
+    description="Store/menu repurchase metrics",
+))
@@ -0,0 +1,91 @@
+"""
+Customer segmentation for Tesla Portfolio Analytics Platform
+Vectorized threshold tiers and the segment definitions used by the dashboard pages
+
+Two separate schemes live here and are not interchangeable:
+- Customer tiers (VIP / Heavy / Regular / New) classify heavy-user rows by order
+  quantity or relative order frequency (heavy user pages)
+- User activity segments (Heavy / Regular / Light / Dormant / New Users) are the
+  lifecycle groups of the user segment / MAU page
+"""
+
+import numpy as np
+import pandas as pd
+
+# User activity segments shown on the user segment / MAU page (not customer tiers)
+USER_ACTIVITY_SEGMENTS = ("Heavy Users", "Regular Users", "Light Users", "Dormant Users", "New Users")
+
+# Customer tiers by order quantity for heavy user rows: (label, minimum order quantity), highest tier first
+ORDER_COUNT_TIERS = (
+    ("VIP Customer", 10),
+    ("Heavy User", 5),
+    ("Regular Customer", 2),
+)
+ORDER_COUNT_DEFAULT = "New Customer"
+
+# Customer tiers by relative order frequency: (label, minimum quantile), highest tier first
+FREQUENCY_QUANTILE_TIERS = (
+    ("VIP Customer", 0.75),
+    ("Heavy User", 0.50),
+)
+FREQUENCY_QUANTILE_DEFAULT = "Regular Customer"
+
+
+def _as_float_array(values):
+    return pd.Series(values, copy=False).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def segment_labels(tiers, default):
+    """
+    Segment labels in tier order (highest first, default last)
+
+    Args:
+        tiers (tuple): (label, threshold) pairs
+        default (str): Label below every tier
+
+    Returns:
+        list: Ordered segment labels (e.g., for chart category order)
+    """
+    return [label for label, _ in tiers] + [default]
+
+
+def assign_segments(values, tiers=ORDER_COUNT_TIERS, default=ORDER_COUNT_DEFAULT):
+    """
+    Assign a segment to every value with one vectorized threshold pass
+
+    Args:
+        values (array-like): Values to segment (e.g., order quantity per row)
+        tiers (tuple): (label, minimum value) pairs, highest tier first
+        default (str): Label for values below every tier (and missing values)
+
+    Returns:
+        np.ndarray: Segment label per value
+    """
+    values = _as_float_array(values)
+    labels = np.array(segment_labels(tiers, default), dtype=object)
+    # Select tier positions (small integers) and map them to labels in one take
+    positions = np.select(
+        [values >= minimum for _, minimum in tiers],
+        np.arange(len(tiers)),
+        default=len(tiers),
+    )
+    return labels[positions]
+
+
+def assign_quantile_segments(values, tiers=FREQUENCY_QUANTILE_TIERS, default=FREQUENCY_QUANTILE_DEFAULT):
+    """
+    Assign segments using thresholds taken from the values' own quantiles
+
+    Args:
+        values (array-like): Values to segment (e.g., average order frequency)
+        tiers (tuple): (label, quantile) pairs, highest tier first
+        default (str): Label for values below every tier
+
+    Returns:
+        np.ndarray: Segment label per value
+    """
+    values = _as_float_array(values)
+    if np.isnan(values).all():
+        return np.full(values.shape, default, dtype=object)
+    thresholds = tuple((label, np.nanquantile(values, quantile)) for label, quantile in tiers)
+    return assign_segments(values, thresholds, default)
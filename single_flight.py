@@ -0,0 +1,80 @@
+"""
+Single-flight call de-duplication for Tesla Portfolio Analytics Platform
+Concurrent identical warehouse queries share one in-flight execution
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed = False
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time
+
+    The first thread to request a key (the leader) runs the function; threads
+    requesting the same key while it runs wait and receive the leader's result,
+    or its exception. Nothing is cached once the call finishes.
+
+    Args:
+        retry_on (tuple): Exception types that only concern the leader (e.g., its
+            query was cancelled); waiting threads retry instead of re-raising them
+    """
+
+    def __init__(self, retry_on=()):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._retry_on = tuple(retry_on)
+
+    def do(self, key, fn):
+        """
+        Run fn for key, or wait for the in-flight call for the same key
+
+        Args:
+            key (Hashable): Identity of the call (e.g., SQL text and bind values)
+            fn (callable): Zero-argument function producing the result
+
+        Returns:
+            tuple: (result, shared) where shared is True when the result came from
+                another thread's call (the object is then shared with that thread)
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                return self._run(key, call, fn)
+
+            call.done.wait()
+            if call.completed:
+                return call.result, True
+            if call.error is not None and not isinstance(call.error, self._retry_on):
+                raise call.error
+            # Leader was interrupted or cancelled; try again, possibly as leader
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            call.completed = True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of calls currently running"""
+        with self._lock:
+            return len(self._calls)
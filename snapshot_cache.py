@@ -0,0 +1,226 @@
+"""
+Disk snapshot cache for Tesla Portfolio Analytics Platform
+Query results stored as Parquet or Arrow IPC on a volume shared by every app replica
+
+Arrow IPC snapshots are written uncompressed and opened through a memory map, so
+numeric and date columns of the loaded DataFrame point straight into the page
+cache: every session and replica on the host shares one physical copy.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Shared docker volume (see docker-compose.yml); empty disables the cache
+SNAPSHOT_DIR = os.getenv("QUERY_SNAPSHOT_DIR", "cache/snapshots")
+
+# Total size kept on disk; least recently used snapshots are evicted beyond this
+SNAPSHOT_MAX_BYTES = int(os.getenv("QUERY_SNAPSHOT_MAX_MB", "2048")) * 1024 * 1024
+
+# Snapshot format -> file suffix
+SNAPSHOT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+CREATED_AT_KEY = b"snapshot_created_at"
+
+_evict_lock = threading.Lock()
+
+
+def snapshot_dir():
+    """Snapshot directory, created on first use (None when disabled or not writable)"""
+    if not SNAPSHOT_DIR:
+        return None
+    path = Path(SNAPSHOT_DIR)
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        logger.warning("snapshot cache disabled, cannot create %s: %s", path, e)
+        return None
+    return path
+
+
+def snapshot_key(name, schema, brand, params=()):
+    """
+    File name for a query result
+
+    Args:
+        name (str): Registered query name
+        schema (str): Brand schema
+        brand (str): Brand key
+        params (tuple): Frozen (hashable, ordered) query parameters
+
+    Returns:
+        str: '<name>-<digest>' (stable across processes and replicas)
+    """
+    digest = hashlib.sha256(repr((name, schema, brand, params)).encode("utf-8")).hexdigest()[:24]
+    return f"{name}-{digest}"
+
+
+def _read_parquet(path, ttl):
+    metadata = pq.read_schema(path).metadata or {}
+    created_at = float(metadata.get(CREATED_AT_KEY, b"0"))
+    if time.time() - created_at >= ttl:
+        return None, None
+    return pq.read_table(path).to_pandas(), created_at
+
+
+def _read_arrow(path, ttl):
+    # Buffers keep the mapping alive after the file handle is closed
+    with pa.memory_map(str(path), "r") as source:
+        reader = ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        created_at = float(metadata.get(CREATED_AT_KEY, b"0"))
+        if time.time() - created_at >= ttl:
+            return None, None
+        table = reader.read_all()
+    # split_blocks keeps numeric/date columns as zero-copy (read-only) views of the map
+    return table.to_pandas(split_blocks=True), created_at
+
+
+def load(key, ttl, fmt="parquet"):
+    """
+    Read a snapshot written less than ttl seconds ago
+
+    Args:
+        key (str): snapshot_key() result
+        ttl (float): Maximum snapshot age in seconds
+        fmt (str): 'parquet' or 'arrow' (memory-mapped, read-only columns)
+
+    Returns:
+        tuple: (DataFrame, created_at epoch seconds), or (None, None) on a miss
+    """
+    directory = snapshot_dir()
+    if directory is None:
+        return None, None
+    path = directory / f"{key}{SNAPSHOT_FORMATS[fmt]}"
+
+    try:
+        if fmt == "arrow":
+            frame, created_at = _read_arrow(path, ttl)
+        else:
+            frame, created_at = _read_parquet(path, ttl)
+        if frame is None:
+            return None, None
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError, pa.ArrowException) as e:
+        # Partial or corrupt file (e.g., volume full); drop it and fall back to the warehouse
+        logger.warning("snapshot %s unreadable, removing: %s", path.name, e)
+        path.unlink(missing_ok=True)
+        return None, None
+
+    # mtime tracks last use for LRU eviction; age comes from the embedded timestamp
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return frame, created_at
+
+
+def store(key, frame, created_at=None, fmt="parquet"):
+    """
+    Write a snapshot atomically (temp file + rename) and evict old snapshots
+
+    Readers on other replicas see either the previous file or the complete new one;
+    existing memory maps of a replaced file stay valid until they are released.
+
+    Args:
+        key (str): snapshot_key() result
+        frame (pd.DataFrame): Query result
+        created_at (float): Epoch seconds the data was loaded (default now)
+        fmt (str): 'parquet' (zstd) or 'arrow' (uncompressed IPC, for memory mapping)
+
+    Returns:
+        bool: Whether the snapshot was written
+    """
+    directory = snapshot_dir()
+    if directory is None:
+        return False
+
+    try:
+        # Mixed-type object columns, Decimal overflow, ... make the snapshot optional, not the query
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    except pa.ArrowException as e:
+        logger.warning("snapshot %s not written, frame not convertible to Arrow: %s", key, e)
+        return False
+    metadata = dict(table.schema.metadata or {})
+    metadata[CREATED_AT_KEY] = str(created_at or time.time()).encode("ascii")
+    table = table.replace_schema_metadata(metadata)
+
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=f".{key}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "arrow":
+                with ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            else:
+                pq.write_table(table, f, compression="zstd")
+        os.replace(temp_name, directory / f"{key}{SNAPSHOT_FORMATS[fmt]}")
+    except (OSError, pa.ArrowException) as e:
+        logger.warning("snapshot %s not written: %s", key, e)
+        Path(temp_name).unlink(missing_ok=True)
+        return False
+
+    evict(directory)
+    return True
+
+
+def _snapshot_files(directory, name=None):
+    prefix = f"{name}-" if name else ""
+    for suffix in SNAPSHOT_FORMATS.values():
+        yield from directory.glob(f"{prefix}*{suffix}")
+
+
+def evict(directory=None, max_bytes=None):
+    """
+    Remove least recently used snapshots until the directory fits max_bytes
+
+    Returns:
+        int: Number of snapshots removed
+    """
+    directory = directory or snapshot_dir()
+    max_bytes = SNAPSHOT_MAX_BYTES if max_bytes is None else max_bytes
+    if directory is None:
+        return 0
+
+    with _evict_lock:
+        entries = []
+        for path in _snapshot_files(directory):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another replica
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+    if removed:
+        logger.info("snapshot cache evicted %d files, %.1f MB kept", removed, total / 1024 / 1024)
+    return removed
+
+
+def clear(name=None):
+    """Delete snapshots for one query (or all); returns the number removed"""
+    directory = snapshot_dir()
+    if directory is None:
+        return 0
+    removed = 0
+    for path in list(_snapshot_files(directory, name)):
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
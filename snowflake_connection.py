@@ -4,9 +4,30 @@
 from snowflake.snowpark.context import get_active_session
 from snowflake.snowpark import Session
 import os
+import time
+import threading
 import toml
 from pathlib import Path
 
+from snowflake_connection_simple import iter_arrow_batches
+
+# 세션 풀 기본값 (환경 변수 또는 [snowflake] 설정으로 재정의 가능)
+DEFAULT_POOL_SIZE = 4                 # 프로세스당 최대 Snowpark 세션 수
+DEFAULT_IDLE_TIMEOUT = 600            # 유휴 세션 제거 기준 (초)
+DEFAULT_MAX_LIFETIME = 3 * 3600       # 세션 최대 수명 (초) - 4시간 토큰 만료 전에 교체
+DEFAULT_HEALTH_CHECK_INTERVAL = 60    # 유휴 세션 재사용 전 헬스체크 주기 (초)
+DEFAULT_ACQUIRE_TIMEOUT = 30          # 풀이 가득 찼을 때 대기 시간 (초)
+DEFAULT_CONNECT_RETRY_BACKOFF = 60    # 연결 실패 후 재시도까지 대기 시간 (초) - 그동안 MockSession 사용
+
+# 세션 만료/종료로 판단하는 Snowflake 오류 코드 및 메시지
+SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114}
+SESSION_EXPIRED_MESSAGES = (
+    "token has expired",
+    "session no longer exists",
+    "session has been closed",
+    "connection is closed",
+)
+
 def load_config():
     """
     설정을 로드합니다. 우선순위:
@@ -47,16 +68,12 @@ def load_config():
     print("설정 파일을 찾을 수 없습니다.")
     return None
 
-def create_snowflake_session():
+def build_connection_parameters(config):
     """
-    Snowflake 세션을 생성하는 함수
+    설정에서 Snowflake 연결 파라미터를 구성합니다.
+    인증 정보가 없으면 None을 반환합니다.
     """
     
-    # 설정 로드
-    config = load_config()
-    if not config:
-        return None
-    
     # 필수 연결 파라미터
     connection_parameters = {
         "account": os.getenv("SNOWFLAKE_ACCOUNT") or config.get("account"),
@@ -95,7 +112,21 @@ def create_snowflake_session():
         return None
     
     # None 값 제거
-    connection_parameters = {k: v for k, v in connection_parameters.items() if v is not None}
+    return {k: v for k, v in connection_parameters.items() if v is not None}
+
+def create_snowflake_session():
+    """
+    Snowflake 세션을 생성하는 함수
+    """
+    
+    # 설정 로드
+    config = load_config()
+    if not config:
+        return None
+    
+    connection_parameters = build_connection_parameters(config)
+    if not connection_parameters:
+        return None
     
     try:
         session = Session.builder.configs(connection_parameters).create()
@@ -105,11 +136,360 @@ def create_snowflake_session():
         print(f"Snowflake 연결 실패: {e}")
         return None
 
+def is_session_expired_error(error):
+    """
+    세션 만료/종료로 인한 오류인지 판단합니다. (재연결 후 재시도 대상)
+    """
+    if getattr(error, "errno", None) in SESSION_EXPIRED_ERRNOS:
+        return True
+    message = str(error).lower()
+    return any(text in message for text in SESSION_EXPIRED_MESSAGES)
+
+class _PooledSessionEntry:
+    """풀에서 관리하는 Snowpark 세션과 사용 시각 정보"""
+    
+    def __init__(self, session):
+        now = time.monotonic()
+        self.session = session
+        self.created_at = now
+        self.last_used_at = now
+        self.last_checked_at = now
+
+class SnowparkSessionPool:
+    """
+    프로세스 전역 Snowpark 세션 풀
+    
+    - 최대 세션 수 제한 (초과 시 acquire_timeout 동안 대기)
+    - 유휴 세션 재사용 전 헬스체크 (SELECT 1)
+    - 유휴 시간/최대 수명 초과 세션 제거
+    - 만료된 세션은 폐기 후 새 세션으로 재연결
+    """
+    
+    def __init__(self, connection_parameters, max_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, max_lifetime=DEFAULT_MAX_LIFETIME,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self._connection_parameters = connection_parameters
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle = []       # 유휴 세션 (LIFO - 최근 사용 세션 우선 재사용)
+        self._size = 0        # 유휴 + 사용 중 세션 수
+        self._cond = threading.Condition()
+    
+    def checkout(self):
+        """풀에서 세션을 하나 꺼냅니다. (없으면 새로 로그인)"""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                expired = self._pop_expired_locked()
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Snowflake 세션 풀 대기 시간 초과 (최대 {self.max_size}개 사용 중)"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+            self._close_entries(expired)
+            
+            if create:
+                try:
+                    session = Session.builder.configs(self._connection_parameters).create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                return _PooledSessionEntry(session)
+            
+            if self._is_healthy(entry):
+                return entry
+            self.discard(entry)
+    
+    def checkin(self, entry):
+        """사용이 끝난 세션을 풀에 반환합니다."""
+        entry.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+    
+    def discard(self, entry):
+        """만료/오류 세션을 닫고 풀에서 제거합니다."""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_entries([entry])
+    
+    def close_all(self):
+        """유휴 세션을 모두 닫습니다. (사용 중 세션은 반환 시점에 재사용)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        self._close_entries(idle)
+    
+    def stats(self):
+        """풀 상태 (관리자 페이지/디버깅용)"""
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+    
+    def _pop_expired_locked(self):
+        now = time.monotonic()
+        keep, expired = [], []
+        for entry in self._idle:
+            if (now - entry.last_used_at > self.idle_timeout
+                    or now - entry.created_at > self.max_lifetime):
+                expired.append(entry)
+            else:
+                keep.append(entry)
+        self._idle = keep
+        self._size -= len(expired)
+        return expired
+    
+    def _is_healthy(self, entry):
+        now = time.monotonic()
+        try:
+            if entry.session.connection.is_closed():
+                return False
+            if now - entry.last_checked_at >= self.health_check_interval:
+                entry.session.sql("SELECT 1").collect()
+                entry.last_checked_at = now
+            return True
+        except Exception as e:
+            print(f"Snowflake 세션 헬스체크 실패, 재연결합니다: {e}")
+            return False
+    
+    @staticmethod
+    def _close_entries(entries):
+        for entry in entries:
+            try:
+                entry.session.close()
+            except Exception:
+                pass
+
+class _PooledQuery:
+    """
+    session.sql(...) 결과를 대신하는 지연 실행 객체
+    실행 시점(to_pandas/collect 등)에만 풀에서 세션을 빌려 사용합니다.
+    """
+    
+    def __init__(self, pool, query, params=None):
+        self._pool = pool
+        self._query = query
+        self._params = params
+    
+    def _execute(self, method, *args, **kwargs):
+        for attempt in (1, 2):
+            entry = self._pool.checkout()
+            try:
+                dataframe = entry.session.sql(self._query, params=self._params)
+                result = getattr(dataframe, method)(*args, **kwargs)
+            except Exception as e:
+                if is_session_expired_error(e):
+                    # 만료된 세션은 폐기하고 새 세션으로 한 번 재시도
+                    self._pool.discard(entry)
+                    if attempt == 1:
+                        continue
+                    raise
+                self._pool.checkin(entry)
+                raise
+            self._pool.checkin(entry)
+            return result
+    
+    def to_pandas(self, *args, **kwargs):
+        return self._execute("to_pandas", *args, **kwargs)
+    
+    def to_pandas_async(self):
+        """
+        쿼리를 비동기로 제출하고 작업 객체를 반환합니다. (Snowflake query ID 기반)
+        결과를 받거나 취소할 때까지 세션을 점유합니다.
+        """
+        for attempt in (1, 2):
+            entry = self._pool.checkout()
+            try:
+                job = entry.session.sql(self._query, params=self._params).to_pandas(block=False)
+            except Exception as e:
+                if is_session_expired_error(e):
+                    self._pool.discard(entry)
+                    if attempt == 1:
+                        continue
+                    raise
+                self._pool.checkin(entry)
+                raise
+            return _PooledAsyncJob(self._pool, entry, job)
+    
+    def collect(self, *args, **kwargs):
+        return self._execute("collect", *args, **kwargs)
+    
+    def count(self, *args, **kwargs):
+        return self._execute("count", *args, **kwargs)
+    
+    def to_pandas_batches(self, *args, **kwargs):
+        # 배치를 모두 소비할 때까지 세션을 점유합니다.
+        entry = self._pool.checkout()
+        try:
+            dataframe = entry.session.sql(self._query, params=self._params)
+            for batch in dataframe.to_pandas_batches(*args, **kwargs):
+                yield batch
+        except Exception as e:
+            if is_session_expired_error(e):
+                self._pool.discard(entry)
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._pool.checkin(entry)
+    
+    def to_arrow_batches(self):
+        # 세션의 커넥터 커넥션에서 Arrow 배치를 그대로 받아옵니다. (pandas 변환 없음)
+        # 배치를 모두 소비할 때까지 세션을 점유합니다.
+        entry = self._pool.checkout()
+        try:
+            for batch in iter_arrow_batches(self._query, self._params, connection=entry.session.connection):
+                yield batch
+        except Exception as e:
+            if is_session_expired_error(e):
+                self._pool.discard(entry)
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._pool.checkin(entry)
+
+class _PooledAsyncJob:
+    """
+    Snowpark AsyncJob 래퍼
+    result() 또는 cancel() 호출 시 빌린 세션을 풀에 반납합니다.
+    """
+    
+    def __init__(self, pool, entry, job):
+        self._pool = pool
+        self._entry = entry
+        self._job = job
+    
+    @property
+    def query_id(self):
+        return self._job.query_id
+    
+    def is_done(self):
+        return self._job.is_done()
+    
+    def result(self):
+        try:
+            result = self._job.result()
+        except Exception as e:
+            self._release(discard=is_session_expired_error(e))
+            raise
+        self._release()
+        return result
+    
+    def cancel(self):
+        try:
+            self._job.cancel()
+        finally:
+            self._release()
+    
+    def _release(self, discard=False):
+        entry, self._entry = self._entry, None
+        if entry is None:
+            return
+        if discard:
+            self._pool.discard(entry)
+        else:
+            self._pool.checkin(entry)
+
+class PooledSession:
+    """
+    세션 풀을 Snowpark Session처럼 사용할 수 있게 하는 프록시
+    페이지 모듈은 기존과 동일하게 session.sql(query).to_pandas()를 호출합니다.
+    """
+    
+    def __init__(self, pool):
+        self.pool = pool
+    
+    def sql(self, query, params=None):
+        return _PooledQuery(self.pool, query, params)
+
+def _pool_option(config, key, env_name, default):
+    value = os.getenv(env_name) or config.get(key)
+    try:
+        return type(default)(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+_session_pool = None
+_session_pool_failed_at = None
+_session_pool_lock = threading.Lock()
+
+def get_session_pool():
+    """
+    프로세스 전역 세션 풀을 반환합니다. (최초 호출 시 생성 및 연결 확인)
+    """
+    global _session_pool, _session_pool_failed_at
+    with _session_pool_lock:
+        if _session_pool is not None:
+            return _session_pool
+        
+        # 연결 실패 직후에는 모든 rerun이 로그인 타임아웃을 기다리지 않도록 재시도를 미룸
+        retry_backoff = float(os.getenv("SNOWFLAKE_CONNECT_RETRY_BACKOFF", DEFAULT_CONNECT_RETRY_BACKOFF))
+        if _session_pool_failed_at is not None and time.time() - _session_pool_failed_at < retry_backoff:
+            return None
+        
+        config = load_config()
+        if not config:
+            return None
+        connection_parameters = build_connection_parameters(config)
+        if not connection_parameters:
+            return None
+        
+        pool = SnowparkSessionPool(
+            connection_parameters,
+            max_size=_pool_option(config, "pool_size", "SNOWFLAKE_POOL_SIZE", DEFAULT_POOL_SIZE),
+            idle_timeout=_pool_option(config, "pool_idle_timeout", "SNOWFLAKE_POOL_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT),
+            max_lifetime=_pool_option(config, "pool_max_lifetime", "SNOWFLAKE_POOL_MAX_LIFETIME", DEFAULT_MAX_LIFETIME),
+            health_check_interval=_pool_option(config, "pool_health_check_interval", "SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL),
+            acquire_timeout=_pool_option(config, "pool_acquire_timeout", "SNOWFLAKE_POOL_ACQUIRE_TIMEOUT", DEFAULT_ACQUIRE_TIMEOUT),
+        )
+        
+        # 첫 세션을 미리 만들어 연결 가능 여부를 확인
+        try:
+            pool.checkin(pool.checkout())
+        except Exception as e:
+            print(f"Snowflake 연결 실패: {e} ({retry_backoff:.0f}초 후 재시도)")
+            _session_pool_failed_at = time.time()
+            return None
+        
+        print(f"Snowflake 세션 풀 생성 완료! (최대 {pool.max_size}개)")
+        _session_pool = pool
+        _session_pool_failed_at = None
+        return _session_pool
+
+def get_session():
+    """
+    페이지 모듈의 show_page(session, ...)에 전달할 풀링된 세션을 반환합니다.
+    연결할 수 없으면 None을 반환합니다.
+    """
+    pool = get_session_pool()
+    if pool is None:
+        return None
+    return PooledSession(pool)
+
 def get_active_session():
     """
     Streamlit에서 사용할 수 있는 활성 세션을 반환합니다.
+    (매 rerun마다 로그인하지 않도록 세션 풀을 사용)
     """
-    return create_snowflake_session()
+    return get_session()
 
 # 테스트용
 if __name__ == "__main__":
@@ -1,45 +1,292 @@
 # 간단한 Snowflake 연결 방식 (snowflake-connector 사용)
+# 앱 페이지는 snowflake_connection의 Snowpark 세션 풀을 사용합니다.
+# 이 모듈은 Snowpark 없이 커넥터만으로 조회하는 스크립트/관리 작업용이며,
+# 쿼리는 execute_query / iter_arrow_batches / pooled_cursor 로 실행합니다. (하단 사용 예시 참고)
+# 앱의 스트리밍 내보내기(data_export)는 Snowpark 세션의 커넥션으로 iter_arrow_batches를 사용합니다.
+import threading
+import time
+from contextlib import closing, contextmanager
 import streamlit as st
 import snowflake.connector
 import pandas as pd
+import pyarrow as pa
+
+POOL_MAX_SIZE = 4             # 프로세스당 최대 커넥션 수
+POOL_CHECKOUT_TIMEOUT = 30    # 풀이 가득 찼을 때 대기 시간 (초)
+
+def _connect():
+    """
+    Streamlit secrets 설정으로 새 커넥션을 생성합니다.
+    """
+    return snowflake.connector.connect(
+        account=st.secrets["snowflake"]["account"],
+        user=st.secrets["snowflake"]["user"],
+        private_key=st.secrets["snowflake"]["private_key"],
+        warehouse=st.secrets["snowflake"]["warehouse"],
+        database=st.secrets["snowflake"]["database"],
+        schema=st.secrets["snowflake"]["schema"]
+    )
+
+class PooledConnection:
+    """풀에서 관리하는 커넥션과 사용 통계"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.query_count = 0
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+
+    def is_closed(self):
+        try:
+            return self.conn.is_closed()
+        except Exception:
+            return True
+
+class ConnectionPool:
+    """
+    snowflake-connector 커넥션 풀
+
+    - checkout/checkin 방식으로 커넥션을 재사용 (쿼리마다 로그인하지 않음)
+    - 최대 커넥션 수 제한 (초과 시 checkout_timeout 동안 대기)
+    - 커넥션별 쿼리 수 집계
+    - 닫힌 커넥션은 checkout 시 자동으로 새 커넥션으로 교체
+    """
+
+    def __init__(self, connect=_connect, max_size=POOL_MAX_SIZE, checkout_timeout=POOL_CHECKOUT_TIMEOUT):
+        self._connect = connect
+        self.max_size = max(1, int(max_size))
+        self.checkout_timeout = checkout_timeout
+        self._idle = []
+        self._all = []
+        self._cond = threading.Condition()
+
+    def checkout(self):
+        """유휴 커넥션을 꺼내거나, 여유가 있으면 새로 연결합니다."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            pooled = None
+            with self._cond:
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif len(self._all) < self.max_size:
+                    pooled = PooledConnection(None)
+                    self._all.append(pooled)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Snowflake 커넥션 풀 대기 시간 초과 (최대 {self.max_size}개 사용 중)"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if pooled.conn is not None and not pooled.is_closed():
+                return pooled
+
+            # 새 슬롯이거나 닫힌 커넥션이면 교체
+            if pooled.conn is not None:
+                print("닫힌 Snowflake 커넥션을 새 커넥션으로 교체합니다.")
+            try:
+                pooled.conn = self._connect()
+            except Exception:
+                self._remove(pooled)
+                raise
+            pooled.query_count = 0
+            pooled.created_at = time.time()
+            return pooled
+
+    def checkin(self, pooled):
+        """커넥션을 풀에 반환합니다. 닫힌 커넥션은 풀에서 제거합니다."""
+        pooled.last_used_at = time.time()
+        if pooled.is_closed():
+            self._remove(pooled)
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def close_all(self):
+        """유휴 커넥션을 모두 닫습니다."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            for pooled in idle:
+                self._all.remove(pooled)
+            self._cond.notify_all()
+        for pooled in idle:
+            try:
+                pooled.conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """풀 상태 및 커넥션별 쿼리 수"""
+        with self._cond:
+            return {
+                "size": len(self._all),
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "connections": [
+                    {"query_count": p.query_count, "created_at": p.created_at, "last_used_at": p.last_used_at}
+                    for p in self._all
+                ],
+            }
+
+    def _remove(self, pooled):
+        with self._cond:
+            if pooled in self._all:
+                self._all.remove(pooled)
+            self._cond.notify()
+
+class _CountingCursor:
+    """실행한 문장 수를 풀 커넥션의 query_count에 집계하는 커서 래퍼"""
+
+    def __init__(self, cursor, pooled):
+        self._cursor = cursor
+        self._pooled = pooled
+
+    def execute(self, *args, **kwargs):
+        self._pooled.query_count += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._pooled.query_count += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _CountingConnection:
+    """cursor()가 집계용 커서를 반환하는 커넥션 래퍼"""
+
+    def __init__(self, conn, pooled):
+        self._conn = conn
+        self._pooled = pooled
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._pooled)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
 
 @st.cache_resource
-def get_snowflake_connection():
+def get_connection_pool():
     """
-    간단한 Snowflake 연결 (snowflake-connector 사용)
+    프로세스 전역 커넥션 풀 (Streamlit 세션/rerun 간 공유)
     """
+    return ConnectionPool()
+
+@contextmanager
+def pooled_connection():
+    """
+    풀에서 커넥션을 빌려 사용하고 자동으로 반환합니다.
+    커넥션에서 만든 커서의 execute 호출마다 query_count가 1씩 증가합니다.
+
+    with pooled_connection() as conn:
+        ...
+    """
+    pool = get_connection_pool()
+    pooled = pool.checkout()
     try:
-        # Streamlit secrets에서 설정 읽기
-        conn = snowflake.connector.connect(
-            account=st.secrets["snowflake"]["account"],
-            user=st.secrets["snowflake"]["user"],
-            private_key=st.secrets["snowflake"]["private_key"],
-            warehouse=st.secrets["snowflake"]["warehouse"],
-            database=st.secrets["snowflake"]["database"],
-            schema=st.secrets["snowflake"]["schema"]
-        )
-        print("Snowflake 연결 성공! (connector 방식)")
-        return conn
-    except Exception as e:
-        print(f"Snowflake 연결 실패: {e}")
-        return None
+        yield _CountingConnection(pooled.conn, pooled)
+    finally:
+        pool.checkin(pooled)
 
-def execute_query(query):
+@contextmanager
+def pooled_cursor():
     """
-    SQL 쿼리 실행하여 DataFrame 반환
+    풀에서 빌린 커넥션의 커서를 제공합니다. 커서는 종료 시 닫히고 커넥션은 풀로 반환됩니다.
+
+    with pooled_cursor() as cursor:
+        cursor.execute("SELECT ...")
+        rows = cursor.fetchall()
     """
-    conn = get_snowflake_connection()
-    if conn:
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
         try:
-            df = pd.read_sql(query, conn)
-            return df
-        except Exception as e:
-            print(f"쿼리 실행 실패: {e}")
-            return None
+            yield cursor
         finally:
-            conn.close()
-    return None
+            cursor.close()
+
+def _empty_frame(cursor):
+    """결과가 없을 때 컬럼명만 가진 빈 DataFrame"""
+    columns = [column[0] for column in (cursor.description or [])]
+    return pd.DataFrame(columns=columns)
+
+def arrow_to_pandas(table):
+    """
+    Arrow 테이블을 최소 복사로 DataFrame으로 변환합니다.
+    (컬럼별 블록 유지, 변환된 Arrow 버퍼는 즉시 해제)
+    """
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def fetch_arrow_table(cursor):
+    """
+    실행된 커서의 결과를 Arrow 배치로 받아 하나의 테이블로 합칩니다. (배치 복사 없음)
+    결과가 없으면 None을 반환합니다.
+    """
+    batches = list(cursor.fetch_arrow_batches())
+    if not batches:
+        return None
+    # 배치마다 NUMBER 컬럼 정수 폭이 다를 수 있으므로 스키마를 맞춰서 결합
+    return pa.concat_tables(batches, promote_options="permissive")
+
+def fetch_dataframe(cursor, as_arrow=False):
+    """
+    실행된 커서의 결과를 컬럼 단위(Arrow)로 가져옵니다.
+    as_arrow=True이면 Arrow 테이블을, 아니면 DataFrame을 반환합니다.
+    """
+    table = fetch_arrow_table(cursor)
+    if table is None:
+        frame = _empty_frame(cursor)
+        return pa.Table.from_pandas(frame, preserve_index=False) if as_arrow else frame
+    return table if as_arrow else arrow_to_pandas(table)
+
+def iter_arrow_batches(query, params=None, connection=None):
+    """
+    쿼리 결과를 Arrow 테이블 배치 단위로 반환하는 제너레이터
+    대용량 결과(예: 전체 고객 리스트)를 한 번에 메모리에 올리지 않고 처리할 때 사용합니다.
+    배치를 모두 소비하거나 제너레이터가 닫힐 때 커넥션이 풀로 반환됩니다.
+    connection을 지정하면(예: Snowpark 세션의 session.connection) 풀 대신 해당 커넥션에서 실행하며,
+    커서만 닫고 커넥션은 그대로 둡니다.
+    """
+    with (pooled_cursor() if connection is None else closing(connection.cursor())) as cursor:
+        cursor.execute(query, params)
+        for batch in cursor.fetch_arrow_batches():
+            yield batch
+
+def iter_pandas_batches(query, params=None):
+    """
+    쿼리 결과를 DataFrame 배치 단위로 반환하는 제너레이터
+    """
+    for batch in iter_arrow_batches(query, params):
+        yield arrow_to_pandas(batch)
+
+def execute_query(query, params=None, as_arrow=False):
+    """
+    SQL 쿼리 실행하여 DataFrame 반환 (as_arrow=True이면 Arrow 테이블 반환)
+    결과는 Arrow 배치로 받아 조립하므로 행 단위 변환(pd.read_sql)을 거치지 않습니다.
+    커넥션은 닫지 않고 풀에 반환하므로 다음 쿼리에서 재사용됩니다.
+    """
+    try:
+        with pooled_cursor() as cursor:
+            cursor.execute(query, params)
+            return fetch_dataframe(cursor, as_arrow=as_arrow)
+    except Exception as e:
+        print(f"쿼리 실행 실패: {e}")
+        return None
 
 # 사용 예시:
 # df = execute_query("SELECT * FROM COMPANY_DW.ANALYSIS_BRAND_A.DT_BRAND_A_USER_COUNTS")
-# st.dataframe(df) 
\ No newline at end of file
+# st.dataframe(df)
+#
+# table = execute_query("SELECT UID, LAST_ORDER_DATE FROM COMPANY_DW.ANALYSIS_BRAND_A.DT_BRAND_A_NON_NEW_SIG_CUSTOMERS", as_arrow=True)
+#
+# for batch in iter_arrow_batches("SELECT UID FROM COMPANY_DW.ANALYSIS_BRAND_A.DT_BRAND_A_NON_NEW_SIG_CUSTOMERS"):
+#     ...
+#
+# with pooled_cursor() as cursor:
+#     cursor.execute("SELECT COUNT(*) FROM COMPANY_DW.ANALYSIS_BRAND_A.DT_BRAND_A_USER_COUNTS")
+#     print(cursor.fetchone())